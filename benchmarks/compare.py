@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core import utils
+
+
+def _change(base: Optional[float], new: Optional[float]) -> Optional[float]:
+    if base is None or new is None or base <= 0:
+        return None
+    return (new - base) / base
+
+
+def compare(baseline: Dict, candidate: Dict, threshold: float, min_seconds: float = 0.0) -> List[Dict]:
+    """Return one row per stage present in either run, flagging growth above ``threshold``.
+
+    Timing changes of stages faster than ``min_seconds`` in both runs are reported but
+    never flagged, since they are dominated by noise. RSS growth is reported alongside
+    Python peak memory but not flagged either: page-level sampling is too coarse for
+    small stages.
+    """
+    rows: List[Dict] = []
+    names = list(baseline["stages"]) + [name for name in candidate["stages"] if name not in baseline["stages"]]
+    for name in names:
+        old = baseline["stages"].get(name, {})
+        new = candidate["stages"].get(name, {})
+        time_change = _change(old.get("seconds"), new.get("seconds"))
+        memory_change = _change(old.get("peak_mb"), new.get("peak_mb"))
+        flagged_time = time_change if max(old.get("seconds", 0.0), new.get("seconds", 0.0)) >= min_seconds else None
+        rows.append(
+            {
+                "stage": name,
+                "base_seconds": old.get("seconds"),
+                "new_seconds": new.get("seconds"),
+                "time_change": time_change,
+                "base_mb": old.get("peak_mb"),
+                "new_mb": new.get("peak_mb"),
+                "memory_change": memory_change,
+                "base_rss_mb": old.get("rss_mb"),
+                "new_rss_mb": new.get("rss_mb"),
+                "regression": any(change is not None and change > threshold for change in (flagged_time, memory_change)),
+            }
+        )
+    return rows
+
+
+def _fmt(value: Optional[float], pattern: str) -> str:
+    return "-" if value is None else pattern.format(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown/growth counted as a regression.")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Ignore timing changes of faster stages.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any stage regressed.")
+    args = parser.parse_args()
+
+    baseline = utils.load_json(args.baseline)
+    candidate = utils.load_json(args.candidate)
+    if baseline.get("corpus", {}).get("spec") != candidate.get("corpus", {}).get("spec"):
+        print("warning: results were produced from different corpus specs", file=sys.stderr)
+    if baseline.get("format") != candidate.get("format"):
+        print("warning: results were produced with different artifact formats", file=sys.stderr)
+
+    rows = compare(baseline, candidate, args.threshold, args.min_seconds)
+    print(
+        f"{'stage':<22} {'base s':>10} {'new s':>10} {'change':>8} {'base MB':>9} {'new MB':>9} {'change':>8}"
+        f" {'base RSS':>9} {'new RSS':>9}"
+    )
+    for row in rows:
+        print(
+            f"{row['stage']:<22} {_fmt(row['base_seconds'], '{:.4f}'):>10} {_fmt(row['new_seconds'], '{:.4f}'):>10} "
+            f"{_fmt(row['time_change'], '{:+.1%}'):>8} {_fmt(row['base_mb'], '{:.1f}'):>9} "
+            f"{_fmt(row['new_mb'], '{:.1f}'):>9} {_fmt(row['memory_change'], '{:+.1%}'):>8} "
+            f"{_fmt(row['base_rss_mb'], '{:.1f}'):>9} {_fmt(row['new_rss_mb'], '{:.1f}'):>9}"
+            + ("  REGRESSION" if row["regression"] else "")
+        )
+    regressed = [row["stage"] for row in rows if row["regression"]]
+    if regressed:
+        print(f"{len(regressed)} stage(s) regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+    if regressed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import shutil
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from core import utils
+
+
+CORPUS_ROOT = utils.DEFAULT_DATA_DIR / "benchmarks" / "corpus"
+CORPUS_VERSION = 1
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    files: int
+    hunks_per_file: int
+    hunk_lines: int
+    comments_per_file: int = 1
+    seed: int = 0
+
+    @property
+    def fingerprint(self) -> str:
+        material = json.dumps({**asdict(self), "version": CORPUS_VERSION}, sort_keys=True)
+        return hashlib.sha1(material.encode("utf-8")).hexdigest()[:10]
+
+
+SCALES: Dict[str, CorpusSpec] = {
+    "tiny": CorpusSpec(files=10, hunks_per_file=2, hunk_lines=4, comments_per_file=2),
+    "small": CorpusSpec(files=100, hunks_per_file=3, hunk_lines=8, comments_per_file=2),
+    "medium": CorpusSpec(files=1000, hunks_per_file=4, hunk_lines=12),
+    "large": CorpusSpec(files=10000, hunks_per_file=2, hunk_lines=6),
+    "huge-hunks": CorpusSpec(files=20, hunks_per_file=4, hunk_lines=2000, comments_per_file=5),
+}
+
+FUNCTION_TEMPLATE = '''{indent}def {name}(self_or_arg, other=None):
+{indent}    """Synthetic helper {name}."""
+{indent}    total = 0
+{indent}    for item in range(self_or_arg):
+{indent}        total += item * {weight}
+{indent}    if other is not None:
+{indent}        total -= other
+{indent}    return total
+'''
+
+
+def _added_line(indent: str, file_no: int, hunk_no: int, line_no: int) -> str:
+    name = f"value_{hunk_no}_{line_no}"
+    if line_no % 7 == 6:  # E501
+        return f"{indent}{name} = total + {line_no}  # synthetic padding " + "x" * 60
+    if line_no % 5 == 4:  # E222
+        return f"{indent}{name} =  total + {file_no}"
+    return f"{indent}{name} = total + {line_no}"
+
+
+def _module(file_no: int, functions: int, edited: Dict[int, Tuple[int, int]]) -> str:
+    """Render one module; ``edited`` maps function index -> (hunk number, lines to add)."""
+    rows = [f'"""Synthetic module {file_no}."""', ""]
+    class_open = False
+    for fn_no in range(functions):
+        in_class = fn_no % 4 >= 2
+        if in_class and not class_open:
+            rows.extend(["", f"class Widget{fn_no}:"])
+            class_open = True
+        elif not in_class and class_open:
+            class_open = False
+        indent = "    " if in_class else ""
+        if not in_class:
+            rows.append("")
+        body = FUNCTION_TEMPLATE.format(indent=indent, name=f"func_{fn_no}", weight=fn_no + 1).splitlines()
+        if fn_no in edited:
+            hunk_no, count = edited[fn_no]
+            inner = indent + "    "
+            extra = [_added_line(inner, file_no, hunk_no, line_no) for line_no in range(count)]
+            body = body[:3] + extra + body[3:-1] + [f"{inner}return total + {hunk_no}"]
+        rows.extend(body)
+        rows.append("")
+    return "\n".join(rows) + "\n"
+
+
+def _git(repo: Path, *args: str) -> str:
+    return utils.run(["git", "-C", str(repo), *args]).stdout
+
+
+def generate(spec: CorpusSpec, out_dir: Path) -> Dict:
+    """Build a git repo with a base and head commit plus the PR artifacts fetch_pr would write.
+
+    Layout: ``repo/`` (non-bare, head checked out) and ``pr/`` with ``metadata.json``,
+    ``diff.patch`` and ``pull_comments.json``.
+    """
+    rng = random.Random(spec.seed)
+    repo = utils.ensure_dir(out_dir / "repo")
+    pr_dir = utils.ensure_dir(out_dir / "pr")
+    functions = max(2, spec.hunks_per_file * 2)
+    paths = [f"pkg{file_no // 500}/mod_{file_no}.py" for file_no in range(spec.files)]
+
+    _git(repo, "init", "--quiet")
+    _git(repo, "config", "user.email", "bench@example.com")
+    _git(repo, "config", "user.name", "bench")
+    for file_no, rel_path in enumerate(paths):
+        target = repo / rel_path
+        utils.ensure_dir(target.parent)
+        target.write_text(_module(file_no, functions, {}), encoding="utf-8")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "--quiet", "-m", "base")
+    base_sha = _git(repo, "rev-parse", "HEAD").strip()
+
+    # Edit every other function so hunks never merge across functions.
+    for file_no, rel_path in enumerate(paths):
+        edited = {fn_no * 2: (fn_no, spec.hunk_lines) for fn_no in range(spec.hunks_per_file)}
+        (repo / rel_path).write_text(_module(file_no, functions, edited), encoding="utf-8")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "--quiet", "-m", "head")
+    head_sha = _git(repo, "rev-parse", "HEAD").strip()
+
+    patch = _git(repo, "diff", "--no-color", "--no-renames", base_sha, head_sha)
+    (pr_dir / "diff.patch").write_text(patch, encoding="utf-8")
+
+    comments: List[Dict] = []
+    added = _added_lines(patch)
+    for rel_path in paths:
+        lines = added.get(rel_path, [])
+        for line in rng.sample(lines, min(spec.comments_per_file, len(lines))):
+            comments.append(
+                {
+                    "id": len(comments) + 1,
+                    "path": rel_path,
+                    "line": line,
+                    "body": rng.choice(
+                        [
+                            "Consider extracting this into a helper.",
+                            "This shadows an outer variable.",
+                            "Can we add a test for this branch?",
+                            "Nit: spacing around the operator.",
+                        ]
+                    ),
+                }
+            )
+    utils.dump_json(comments, pr_dir / "pull_comments.json")
+
+    repo_info = {"full_name": f"bench/synthetic-{spec.fingerprint}", "clone_url": str(repo.resolve())}
+    metadata = {
+        "number": 1,
+        "title": "Synthetic benchmark PR",
+        "base": {"sha": base_sha, "repo": repo_info},
+        "head": {"sha": head_sha, "repo": repo_info},
+    }
+    utils.dump_json(metadata, pr_dir / "metadata.json")
+
+    info = {
+        "spec": asdict(spec),
+        "version": CORPUS_VERSION,
+        "patch_bytes": len(patch.encode("utf-8")),
+        "added_lines": sum(len(lines) for lines in added.values()),
+        "comments": len(comments),
+    }
+    utils.dump_json(info, out_dir / "corpus.json")
+    return info
+
+
+def _added_lines(patch: str) -> Dict[str, List[int]]:
+    """Cheap added-line scan so comment placement does not depend on the code under test."""
+    added: Dict[str, List[int]] = {}
+    path = None
+    target = 0
+    for line in patch.splitlines():
+        if line.startswith("+++ "):
+            path = line[6:] if line.startswith("+++ b/") else None
+        elif line.startswith("@@"):
+            target = int(line.split("+", 1)[1].split(",", 1)[0].split(" ", 1)[0])
+        elif path is None or line.startswith(("---", "diff ", "index ")):
+            continue
+        elif line.startswith("+"):
+            added.setdefault(path, []).append(target)
+            target += 1
+        elif not line.startswith("-"):
+            target += 1
+    return added
+
+
+def ensure_corpus(spec: CorpusSpec, root: Path = CORPUS_ROOT) -> Path:
+    """Return the corpus directory for ``spec``, generating it on first use."""
+    out_dir = Path(root) / spec.fingerprint
+    if (out_dir / "corpus.json").exists():
+        return out_dir
+    shutil.rmtree(out_dir, ignore_errors=True)
+    generate(spec, out_dir)
+    return out_dir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic PR corpus for benchmarks.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--root", type=Path, default=CORPUS_ROOT)
+    args = parser.parse_args()
+
+    out_dir = ensure_corpus(SCALES[args.scale], args.root)
+    print(json.dumps(utils.load_json(out_dir / "corpus.json"), indent=2))
+    print(f"Corpus at {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import platform
+import shutil
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from argparse import Namespace
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from add_context import add_context  # noqa: E402
+from build_examples import build_examples  # noqa: E402
+from corpus import CORPUS_ROOT, SCALES, ensure_corpus  # noqa: E402
+from diff_parser import parse_patch_file  # noqa: E402
+from merge_lints import merge_lints  # noqa: E402
+
+from core import instrument, utils  # noqa: E402
+from core.git_store import tree_for_metadata  # noqa: E402
+
+
+RESULTS_ROOT = utils.DEFAULT_DATA_DIR / "benchmarks" / "results"
+RSS_INTERVAL = 0.005
+
+
+@dataclass
+class BenchStage:
+    name: str
+    run: Callable[[], Any]
+    setup: Optional[Callable[[], None]] = None
+    skip_reason: Optional[str] = None
+
+
+class RssSampler:
+    """Polls this process's RSS on a background thread and keeps the highest reading."""
+
+    def __init__(self, interval: float = RSS_INTERVAL):
+        self.interval = interval
+        self.start = self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pull-pal-rss", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, instrument.rss_mb())
+
+    def __enter__(self) -> "RssSampler":
+        self.start = self.peak = instrument.rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, instrument.rss_mb())
+
+
+def _timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def measure(fn: Callable[[], Any], repeat: int, trace_memory: bool) -> Dict[str, Any]:
+    """Time ``fn`` ``repeat`` times, then run it once more under tracemalloc for peak memory.
+
+    ``peak_mb`` is the Python heap high-water mark of the traced run. It misses native
+    allocations such as pyarrow buffers, so the last timed run also samples process RSS:
+    ``rss_mb`` is how far RSS rose above its level at the start of that run, and
+    ``peak_rss_mb`` is the process high-water mark once the stage has finished. Memory
+    used by subprocesses (git, flake8) is not included in either.
+    """
+    runs: List[float] = []
+    rss: Dict[str, float] = {}
+    for index in range(repeat):
+        gc.collect()
+        if trace_memory and index == repeat - 1:
+            with RssSampler() as sampler:
+                runs.append(_timed(fn))
+            # Read before the tracemalloc run, whose bookkeeping would inflate RSS.
+            rss = {"rss_mb": round(sampler.peak - sampler.start, 3), "peak_rss_mb": round(instrument.peak_rss_mb(), 3)}
+        else:
+            runs.append(_timed(fn))
+    result: Dict[str, Any] = {
+        "seconds": statistics.median(runs),
+        "min_seconds": min(runs),
+        "runs": [round(value, 6) for value in runs],
+        **rss,
+    }
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_mb"] = round(peak / 2**20, 3)
+    return result
+
+
+def _hf_stage(corpus_dir: Path, work_dir: Path, args: argparse.Namespace) -> BenchStage:
+    try:
+        from make_hf_dataset import tokenize_shard
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, local_files_only=True)
+    except Exception as exc:  # missing deps or tokenizer not cached locally
+        return BenchStage("make_hf_dataset", lambda: None, skip_reason=f"{type(exc).__name__}: {exc}")
+
+    options = Namespace(max_source_length=512, max_target_length=256, num_proc=args.num_proc, max_shard_size="500MB")
+    out_path = work_dir / "hf_shard"
+
+    def run() -> None:
+        shutil.rmtree(out_path, ignore_errors=True)
+        tokenize_shard(work_dir / "examples.jsonl", out_path, tokenizer, options)
+
+    return BenchStage("make_hf_dataset", run)
+
+
+def build_stages(corpus_dir: Path, work_dir: Path, args: argparse.Namespace) -> List[BenchStage]:
+    pr_dir = corpus_dir / "pr"
+    metadata_path = pr_dir / "metadata.json"
+    mirror_root = work_dir / "mirrors"
+    ctx_cache = work_dir / "ctx_cache.sqlite"
+    lint_cache = work_dir / "lint_cache.sqlite"
+
+    def warm_mirror() -> None:
+        mirror, _ = tree_for_metadata(utils.load_json(metadata_path), mirror_root)
+        mirror.close()
+
+    def run_add_context(cache_path: Optional[Path]) -> Callable[[], Any]:
+        return lambda: add_context(
+            utils.artifact_path(work_dir, "diff_summary"),
+            metadata_path,
+            out_path=utils.artifact_path(work_dir, "diff_with_ctx"),
+            cache_path=cache_path,
+            mirror_root=mirror_root,
+        )
+
+    def run_merge_lints(cache_path: Optional[Path]) -> Callable[[], Any]:
+        return lambda: merge_lints(
+            utils.artifact_path(work_dir, "diff_full"),
+            metadata_path=metadata_path,
+            out_path=utils.artifact_path(work_dir, "diff_with_lint"),
+            workers=args.lint_workers,
+            cache_path=cache_path,
+            mirror_root=mirror_root,
+        )
+
+    def run_build_examples() -> None:
+        diff_path = utils.artifact_path(work_dir, "diff_with_lint")
+        if not diff_path.exists():
+            diff_path = utils.artifact_path(work_dir, "diff_full")
+        examples = build_examples(diff_path, utils.artifact_path(work_dir, "diff_with_ctx"), pr_dir / "pull_comments.json")
+        utils.dump_jsonl(examples, work_dir / "examples.jsonl")
+
+    no_flake8 = None if shutil.which("flake8") else "flake8 not on PATH"
+    return [
+        BenchStage("parse_diff", lambda: parse_patch_file(pr_dir / "diff.patch", work_dir)),
+        BenchStage("parse_diff.stream", lambda: parse_patch_file(pr_dir / "diff.patch", work_dir / "stream", stream=True)),
+        BenchStage("add_context", run_add_context(None), setup=warm_mirror),
+        BenchStage("add_context.cached", run_add_context(ctx_cache), setup=run_add_context(ctx_cache)),
+        BenchStage("merge_lints", run_merge_lints(None), skip_reason=no_flake8),
+        BenchStage("merge_lints.cached", run_merge_lints(lint_cache), setup=run_merge_lints(lint_cache), skip_reason=no_flake8),
+        BenchStage("build_examples", run_build_examples),
+        _hf_stage(corpus_dir, work_dir, args),
+    ]
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    utils.ARTIFACT_FORMAT = args.format
+    spec = SCALES[args.scale]
+    overrides = {key: getattr(args, key) for key in ("files", "hunks_per_file", "hunk_lines", "comments_per_file", "seed")}
+    spec = replace(spec, **{key: value for key, value in overrides.items() if value is not None})
+    started = time.perf_counter()
+    corpus_dir = ensure_corpus(spec, args.corpus_root)
+    print(f"Corpus {corpus_dir} ready in {time.perf_counter() - started:.1f}s")
+
+    work_dir = utils.ensure_dir(args.work_dir or corpus_dir / "work")
+    stages: Dict[str, Dict[str, Any]] = {}
+    for stage in build_stages(corpus_dir, work_dir, args):
+        if args.stages and stage.name.split(".")[0] not in args.stages and stage.name not in args.stages:
+            continue
+        if stage.skip_reason:
+            stages[stage.name] = {"skipped": stage.skip_reason}
+            print(f"{stage.name:<22} skipped ({stage.skip_reason})")
+            continue
+        if stage.setup:
+            stage.setup()
+        stages[stage.name] = measure(stage.run, args.repeat, not args.no_memory)
+        peak, rss = stages[stage.name].get("peak_mb"), stages[stage.name].get("rss_mb")
+        print(
+            f"{stage.name:<22} {stages[stage.name]['seconds']:9.4f}s"
+            + (f" {peak:9.1f} MB" if peak is not None else "")
+            + (f" {rss:9.1f} MB RSS" if rss is not None else "")
+        )
+
+    head = utils.run(["git", "rev-parse", "HEAD"], cwd=SCRIPTS_DIR.parent, check=False).stdout.strip()
+    return {
+        "scale": args.scale,
+        "corpus": utils.load_json(corpus_dir / "corpus.json"),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_rev": head or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "format": args.format,
+        "stages": stages,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on a synthetic PR corpus (offline).")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--files", type=int, default=None, help="Override the scale's file count.")
+    parser.add_argument("--hunks-per-file", type=int, default=None)
+    parser.add_argument("--hunk-lines", type=int, default=None, help="Lines added per hunk.")
+    parser.add_argument("--comments-per-file", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--stages", nargs="+", default=None, help="Only run these stages (e.g. parse_diff add_context).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage; the median is reported.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run and RSS sampling per stage.")
+    parser.add_argument("--format", choices=sorted(utils.ARTIFACT_FORMATS), default=utils.ARTIFACT_FORMAT, help="Artifact format.")
+    parser.add_argument("--lint-workers", type=int, default=None)
+    parser.add_argument("--tokenizer", default="microsoft/codebert-base", help="Tokenizer already in the local HF cache.")
+    parser.add_argument("--num-proc", type=int, default=1)
+    parser.add_argument("--corpus-root", type=Path, default=CORPUS_ROOT)
+    parser.add_argument("--work-dir", type=Path, default=None, help="Scratch directory (defaults to <corpus>/work).")
+    parser.add_argument("--out", type=Path, default=None, help="Results JSON (defaults to data/benchmarks/results/).")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    out_path = args.out or RESULTS_ROOT / f"{args.scale}-{stamp}.json"
+    utils.dump_json(results, out_path)
+    print(f"Wrote results to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,3 @@
 """Core helpers for Pull Pal."""
 
-from . import utils, ast_context  # noqa: F401
+from . import utils, ast_context, cache, git_store, github, instrument, prompt  # noqa: F401
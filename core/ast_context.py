@@ -1,9 +1,15 @@
 from __future__ import annotations
 
 import ast
-from dataclasses import dataclass
+from bisect import bisect_right
+from dataclasses import astuple, dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .cache import BlobCache
+from .git_store import TreeSource, WorkTreeSource
+from .instrument import stage
+from .utils import PullPalError
 
 
 @dataclass
@@ -15,58 +21,133 @@ class LineContext:
     signature: Optional[str]
 
 
+@dataclass
+class SymbolSpan:
+    start: int
+    end: int
+    symbol: str
+    symbol_type: str
+    signature: str
+
+
+class SymbolIndex:
+    """Maps lines to their innermost enclosing def/class using sorted segment starts.
+
+    Spans are flattened into non-overlapping segments, each owned by the innermost
+    symbol covering it, so a lookup is a single bisect over O(symbols) entries.
+    """
+
+    def __init__(self, spans: List[SymbolSpan]):
+        self.spans = sorted(spans, key=lambda span: (span.start, -span.end))
+        self._starts: List[int] = [1]
+        self._owners: List[int] = [-1]
+        stack: List[int] = []
+        for idx, span in enumerate(self.spans):
+            while stack and self.spans[stack[-1]].end < span.start:
+                self._close(stack)
+            stack.append(idx)
+            self._starts.append(span.start)
+            self._owners.append(idx)
+        while stack:
+            self._close(stack)
+
+    def _close(self, stack: List[int]) -> None:
+        closed = stack.pop()
+        self._starts.append(self.spans[closed].end + 1)
+        self._owners.append(stack[-1] if stack else -1)
+
+    @classmethod
+    def from_source(cls, source: str) -> "SymbolIndex":
+        return cls(collect_spans(source))
+
+    def lookup(self, line: int) -> Optional[SymbolSpan]:
+        pos = bisect_right(self._starts, line) - 1
+        if pos < 0:
+            return None
+        owner = self._owners[pos]
+        return self.spans[owner] if owner >= 0 else None
+
+
+def _symbol_metadata(node: ast.AST) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        args = [arg.arg for arg in node.args.args]
+        return node.name, "function", f"{node.name}({', '.join(args)})"
+    if isinstance(node, ast.ClassDef):
+        bases = [getattr(base, "id", "?") for base in node.bases]
+        return node.name, "class", f"class {node.name}({', '.join(bases)})"
+    return None, None, None
+
+
+def collect_spans(source: str) -> List[SymbolSpan]:
+    """Return the line spans of every def/class in ``source``."""
+    tree = ast.parse(source)
+    spans: List[SymbolSpan] = []
+    pending: List[ast.AST] = [tree]
+    while pending:
+        node = pending.pop()
+        symbol, symbol_type, signature = _symbol_metadata(node)
+        if symbol:
+            end = getattr(node, "end_lineno", None) or node.lineno
+            spans.append(SymbolSpan(node.lineno, end, symbol, symbol_type, signature))
+        pending.extend(ast.iter_child_nodes(node))
+    return spans
+
+
 class ContextExtractor:
     """Calculates simple lexical context (enclosing class/function) for lines."""
 
-    def __init__(self, repo_root: Path):
-        self.repo_root = Path(repo_root)
-
-    def _read_source(self, rel_path: str) -> str:
-        file_path = self.repo_root / rel_path
-        return file_path.read_text(encoding="utf-8")
+    def __init__(self, repo_root: Path | TreeSource, cache: Optional[BlobCache] = None):
+        self.source = repo_root if isinstance(repo_root, TreeSource) else WorkTreeSource(repo_root)
+        self.cache = cache
+        self._indexes: Dict[str, SymbolIndex] = {}
+        self.bytes_parsed = 0
 
-    def _build_index(self, source: str) -> Dict[int, List[ast.AST]]:
-        tree = ast.parse(source)
-        index: Dict[int, List[ast.AST]] = {}
+    def _read_source(self, rel_path: str) -> bytes:
+        data = self.source.read(rel_path)
+        if data is None:
+            raise PullPalError(f"{rel_path} not found in repository tree")
+        self.bytes_parsed += len(data)
+        return data
 
-        def visit(node: ast.AST, stack: List[ast.AST]) -> None:
-            if hasattr(node, "lineno") and hasattr(node, "end_lineno"):
-                for line in range(node.lineno, getattr(node, "end_lineno", node.lineno) + 1):
-                    index.setdefault(line, []).append(node)
-            for child in ast.iter_child_nodes(node):
-                visit(child, stack + [node])
+    def _load_spans(self, rel_path: str) -> List[SymbolSpan]:
+        if self.cache is None:
+            return collect_spans(self._read_source(rel_path).decode("utf-8"))
+        sha = self.source.blob_sha(rel_path)
+        cached = self.cache.get(sha) if sha else None
+        if cached is not None:
+            return [SymbolSpan(*row) for row in cached]
+        spans = collect_spans(self._read_source(rel_path).decode("utf-8"))
+        if sha:
+            self.cache.put(sha, [astuple(span) for span in spans])
+        return spans
 
-        visit(tree, [])
+    def _index_for(self, rel_path: str) -> SymbolIndex:
+        index = self._indexes.get(rel_path)
+        if index is None:
+            index = SymbolIndex(self._load_spans(rel_path))
+            self._indexes[rel_path] = index
         return index
 
-    @staticmethod
-    def _symbol_metadata(node: ast.AST) -> (Optional[str], Optional[str], Optional[str]):
-        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            args = [arg.arg for arg in node.args.args]
-            return node.name, "function", f"{node.name}({', '.join(args)})"
-        if isinstance(node, ast.ClassDef):
-            bases = [getattr(base, "id", "?") for base in node.bases]
-            return node.name, "class", f"class {node.name}({', '.join(bases)})"
-        return None, None, None
-
     def get_context(self, rel_path: str, lines: Iterable[int]) -> List[LineContext]:
-        source = self._read_source(rel_path)
-        index = self._build_index(source)
+        index = self._index_for(rel_path)
         results: List[LineContext] = []
         for line in lines:
-            nodes = index.get(line, [])
-            symbol = symbol_type = signature = None
-            for node in reversed(nodes):
-                symbol, symbol_type, signature = self._symbol_metadata(node)
-                if symbol:
-                    break
+            span = index.lookup(line)
             results.append(
                 LineContext(
                     path=rel_path,
                     line=line,
-                    symbol=symbol,
-                    symbol_type=symbol_type,
-                    signature=signature,
+                    symbol=span.symbol if span else None,
+                    symbol_type=span.symbol_type if span else None,
+                    signature=span.signature if span else None,
                 )
             )
         return results
+
+    def get_contexts(self, requests: Mapping[str, Iterable[int]]) -> Dict[str, List[LineContext]]:
+        """Resolve many ``path -> lines`` requests, parsing each file at most once."""
+        with stage("ast.contexts", files=len(requests)) as record:
+            parsed_before = self.bytes_parsed
+            contexts = {rel_path: self.get_context(rel_path, lines) for rel_path, lines in requests.items()}
+            record.update(lines=sum(len(found) for found in contexts.values()), bytes=self.bytes_parsed - parsed_before)
+            return contexts
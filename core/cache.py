@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .utils import DEFAULT_DATA_DIR, ensure_dir
+
+
+DEFAULT_CACHE_PATH = DEFAULT_DATA_DIR / "cache" / "blobs.sqlite"
+
+
+class BlobCache:
+    """Persistent JSON store keyed by git blob SHA, partitioned by namespace.
+
+    A blob SHA identifies file contents regardless of path, PR or commit, so any
+    result derived purely from the contents can be reused across the whole backfill.
+    """
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, namespace: str = "default"):
+        self.path = Path(path)
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        ensure_dir(self.path.parent)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " namespace TEXT NOT NULL, sha TEXT NOT NULL, payload TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, sha))"
+        )
+
+    def get(self, sha: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM blobs WHERE namespace = ? AND sha = ?", (self.namespace, sha)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, sha: str, payload: Any) -> None:
+        encoded = json.dumps(payload, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (namespace, sha, payload) VALUES (?, ?, ?)",
+                (self.namespace, sha, encoded),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .instrument import stage
+from .utils import DEFAULT_DATA_DIR, PullPalError, ensure_dir
+
+
+DEFAULT_INDEX_PATH = DEFAULT_DATA_DIR / "cache" / "dedup.sqlite"
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_DIFF_PREFIX = re.compile(r"^[+\- ]", re.MULTILINE)
+
+
+def normalize(example: Dict) -> str:
+    """Hunk and comment text with diff markers, case and whitespace differences removed."""
+    hunk = _DIFF_PREFIX.sub("", example.get("diff_hunk") or "")
+    return " ".join(f"{hunk}\n{example.get('comment') or ''}".lower().split())
+
+
+class MinHasher:
+    """MinHash signatures over word ``shingle``-grams, stable across processes and runs."""
+
+    def __init__(self, num_perm: int = 128, shingle: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle = shingle
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_MERSENNE), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE), size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> List[str]:
+        tokens = _TOKEN.findall(text)
+        if len(tokens) <= self.shingle:
+            return [" ".join(tokens)]
+        return [" ".join(tokens[pos : pos + self.shingle]) for pos in range(len(tokens) - self.shingle + 1)]
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in set(self.shingles(text))), dtype=np.uint64
+        )
+        # Products wrap around uint64, as in the usual numpy MinHash formulation.
+        with np.errstate(over="ignore"):
+            permuted = ((hashes[:, None] * self._a + self._b) % _MERSENNE) & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def jaccard(left: np.ndarray, right: np.ndarray) -> float:
+    return float(np.count_nonzero(left == right)) / len(left)
+
+
+class DedupIndex:
+    """MinHash LSH index persisted in SQLite, so it can grow across runs with bounded memory.
+
+    Signatures are split into ``bands`` bands; examples sharing any band hash are candidates
+    and count as duplicates when their estimated Jaccard similarity reaches ``threshold``.
+    """
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_INDEX_PATH,
+        *,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle: int = 3,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise PullPalError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.path = Path(path)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle, seed)
+        self.kept = 0
+        self.dropped = 0
+        ensure_dir(self.path.parent)
+        self._conn = sqlite3.connect(str(self.path), timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS examples ("
+            " id INTEGER PRIMARY KEY, example_key TEXT NOT NULL UNIQUE, text_sha TEXT NOT NULL, sig BLOB NOT NULL,"
+            " run INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS examples_text ON examples (text_sha);"
+            "CREATE TABLE IF NOT EXISTS bands ("
+            " band INTEGER NOT NULL, hash INTEGER NOT NULL, id INTEGER NOT NULL,"
+            " PRIMARY KEY (band, hash, id)) WITHOUT ROWID;"
+        )
+        self._check_settings({"num_perm": num_perm, "bands": bands, "shingle": shingle, "seed": seed})
+        # Examples indexed by this instance carry its run id, so repeats within a run can be told
+        # apart from examples kept by an earlier run.
+        self.run = self._conn.execute("SELECT COALESCE(MAX(run), 0) + 1 FROM examples").fetchone()[0]
+
+    def _check_settings(self, settings: Dict[str, int]) -> None:
+        stored = dict(self._conn.execute("SELECT key, value FROM settings"))
+        if not stored:
+            self._conn.executemany("INSERT INTO settings VALUES (?, ?)", [(k, str(v)) for k, v in settings.items()])
+            self._conn.commit()
+            return
+        if stored != {key: str(value) for key, value in settings.items()}:
+            raise PullPalError(f"Dedup index {self.path} was built with {stored}; remove it or match its settings")
+
+    def _band_hashes(self, sig: np.ndarray) -> List[Tuple[int, int]]:
+        hashes = []
+        for band in range(self.bands):
+            chunk = sig[band * self.rows : (band + 1) * self.rows].tobytes()
+            hashes.append((band, int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "big", signed=True)))
+        return hashes
+
+    def check(self, example: Dict) -> Optional[int]:
+        """Index ``example`` unless it duplicates one already kept; returns the kept example's id if so.
+
+        An example kept by an earlier run (same content) counts as kept again, so re-running
+        over a file that was deduplicated before is a no-op; repeats within one run are dropped.
+        """
+        example_key = hashlib.sha1(json.dumps(example, sort_keys=True).encode("utf-8")).hexdigest()
+        row = self._conn.execute("SELECT id, run FROM examples WHERE example_key = ?", (example_key,)).fetchone()
+        if row:
+            if row[1] == self.run:
+                self.dropped += 1
+                return row[0]
+            self._conn.execute("UPDATE examples SET run = ? WHERE id = ?", (self.run, row[0]))
+            self.kept += 1
+            return None
+        text = normalize(example)
+        text_sha = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        row = self._conn.execute("SELECT id FROM examples WHERE text_sha = ? LIMIT 1", (text_sha,)).fetchone()
+        if row:
+            self.dropped += 1
+            return row[0]
+        sig = self.hasher.signature(text)
+        bands = self._band_hashes(sig)
+        # Written as ORed equalities so SQLite probes the primary key once per band.
+        matches = " OR ".join("(band = ? AND hash = ?)" for _ in bands)
+        candidates = self._conn.execute(
+            "SELECT id, sig FROM examples WHERE id IN"
+            f" (SELECT id FROM bands WHERE {matches})",
+            [value for pair in bands for value in pair],
+        )
+        for candidate_id, candidate_sig in candidates:
+            if jaccard(sig, np.frombuffer(candidate_sig, dtype=np.uint32)) >= self.threshold:
+                self.dropped += 1
+                return candidate_id
+        cursor = self._conn.execute(
+            "INSERT INTO examples (example_key, text_sha, sig, run) VALUES (?, ?, ?, ?)",
+            (example_key, text_sha, sig.tobytes(), self.run),
+        )
+        self._conn.executemany("INSERT OR IGNORE INTO bands VALUES (?, ?, ?)", [(b, h, cursor.lastrowid) for b, h in bands])
+        self.kept += 1
+        return None
+
+    def filter(self, examples: Iterable[Dict], commit_every: int = 1000) -> Iterator[Dict]:
+        """Yield the examples that are not near-duplicates of earlier ones, indexing them as it goes."""
+        with stage("dedup", index=self.path.name) as record:
+            for count, example in enumerate(examples, 1):
+                if self.check(example) is None:
+                    yield example
+                if count % commit_every == 0:
+                    self._conn.commit()
+            self._conn.commit()
+            record.update(kept=self.kept, dropped=self.dropped)
+
+    def stats(self) -> Dict[str, int]:
+        return {"kept": self.kept, "dropped": self.dropped}
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
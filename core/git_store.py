@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import fcntl
+import subprocess
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from .instrument import stage
+from .utils import DEFAULT_DATA_DIR, PullPalError, ensure_dir, git_blob_sha, run
+
+
+MIRROR_ROOT = DEFAULT_DATA_DIR / "mirrors"
+
+
+class CatFileReader:
+    """Reads objects through long-running ``git cat-file --batch`` processes.
+
+    One ``--batch-check`` process answers SHA lookups and one ``--batch`` process
+    streams contents, so each blob costs a pipe round-trip instead of a fork.
+    """
+
+    def __init__(self, git_dir: Path):
+        self.git_dir = Path(git_dir)
+        self._lock = threading.Lock()
+        self._check = self._spawn("--batch-check")
+        self._batch = self._spawn("--batch")
+
+    def _spawn(self, mode: str) -> subprocess.Popen:
+        return subprocess.Popen(
+            ["git", "--git-dir", str(self.git_dir), "cat-file", mode],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    @staticmethod
+    def _header(proc: subprocess.Popen, spec: str) -> Optional[Tuple[str, str, int]]:
+        proc.stdin.write(spec.encode("utf-8") + b"\n")
+        proc.stdin.flush()
+        header = proc.stdout.readline().decode("utf-8").rstrip("\n")
+        if not header:
+            raise PullPalError(f"git cat-file exited while reading {spec}")
+        # The spec is echoed back verbatim and may itself contain spaces.
+        if header.endswith((" missing", " ambiguous")):
+            return None
+        sha, obj_type, size = header.rsplit(" ", 2)
+        return sha, obj_type, int(size)
+
+    def info(self, spec: str) -> Optional[Tuple[str, str, int]]:
+        with self._lock:
+            return self._header(self._check, spec)
+
+    def read(self, spec: str) -> Optional[bytes]:
+        with self._lock:
+            header = self._header(self._batch, spec)
+            if header is None:
+                return None
+            data = self._batch.stdout.read(header[2])
+            self._batch.stdout.read(1)  # trailing newline
+        return data
+
+    def close(self) -> None:
+        for proc in (self._check, self._batch):
+            if proc.poll() is None:
+                proc.stdin.close()
+                proc.wait()
+
+
+class TreeSource(ABC):
+    """Read-only view of a repository tree at one revision."""
+
+    @abstractmethod
+    def read(self, rel_path: str) -> Optional[bytes]:
+        ...
+
+    def blob_sha(self, rel_path: str) -> Optional[str]:
+        data = self.read(rel_path)
+        return git_blob_sha(data) if data is not None else None
+
+    @contextmanager
+    def materialize(self, rel_paths: Iterable[str]) -> Iterator[Path]:
+        """Yield a directory containing ``rel_paths`` for tools that need real files."""
+        with tempfile.TemporaryDirectory(prefix="pull-pal-") as tmp:
+            root = Path(tmp)
+            with stage("git.materialize", files=0, bytes=0) as record:
+                for rel_path in rel_paths:
+                    data = self.read(rel_path)
+                    if data is None:
+                        continue
+                    target = root / rel_path
+                    ensure_dir(target.parent)
+                    target.write_bytes(data)
+                    record["files"] += 1
+                    record["bytes"] += len(data)
+            yield root
+
+
+class WorkTreeSource(TreeSource):
+    """Files from an existing checkout on disk."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def read(self, rel_path: str) -> Optional[bytes]:
+        file_path = self.root / rel_path
+        return file_path.read_bytes() if file_path.is_file() else None
+
+    @contextmanager
+    def materialize(self, rel_paths: Iterable[str]) -> Iterator[Path]:
+        yield self.root
+
+
+class GitTreeSource(TreeSource):
+    """Blobs of ``rev`` read straight from a git object store, without a checkout."""
+
+    def __init__(self, reader: CatFileReader, rev: str):
+        self.reader = reader
+        self.rev = rev
+        self._shas: Dict[str, Optional[str]] = {}
+
+    def read(self, rel_path: str) -> Optional[bytes]:
+        return self.reader.read(f"{self.rev}:{rel_path}")
+
+    def blob_sha(self, rel_path: str) -> Optional[str]:
+        if rel_path not in self._shas:
+            info = self.reader.info(f"{self.rev}:{rel_path}")
+            self._shas[rel_path] = info[0] if info and info[1] == "blob" else None
+        return self._shas[rel_path]
+
+
+class RepoMirror:
+    """Bare mirror of one repository shared by every PR ingested from it.
+
+    PR heads are fetched into the mirror through ``refs/pull/<n>/head``, which
+    GitHub publishes on the base repository even when the PR comes from a fork.
+    """
+
+    def __init__(self, clone_url: str, path: Path):
+        self.clone_url = clone_url
+        self.path = Path(path)
+        self._reader: Optional[CatFileReader] = None
+
+    @classmethod
+    def for_metadata(cls, metadata: Dict, root: Path = MIRROR_ROOT) -> "RepoMirror":
+        base_repo = metadata["base"]["repo"]
+        slug = base_repo["full_name"].replace("/", "_").replace(" ", "-")
+        return cls(base_repo["clone_url"], Path(root) / f"{slug}.git")
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        ensure_dir(self.path.parent)
+        with open(self.path.with_suffix(".lock"), "w") as lock_fh:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _git(self, *args: str, check: bool = True) -> subprocess.CompletedProcess:
+        return run(["git", "--git-dir", str(self.path), *args], check=check)
+
+    def has_commit(self, sha: str) -> bool:
+        return self.path.exists() and self._git("cat-file", "-e", f"{sha}^{{commit}}", check=False).returncode == 0
+
+    def ensure_commit(self, sha: str, *, pr: Optional[int] = None, fallback_url: Optional[str] = None) -> None:
+        if self.has_commit(sha):
+            return
+        with stage("git.fetch_commit", sha=sha[:12], mirror=self.path.name), self._locked():
+            if not self.path.exists():
+                run(["git", "clone", "--bare", "--quiet", self.clone_url, str(self.path)])
+            if self.has_commit(sha):
+                return
+            attempts = [("origin", "+refs/heads/*:refs/heads/*")]
+            if pr is not None:
+                attempts.insert(0, ("origin", f"+refs/pull/{pr}/head:refs/pull/{pr}/head"))
+            if fallback_url:
+                attempts.append((fallback_url, sha))
+            for remote, refspec in attempts:
+                self._git("fetch", "--quiet", remote, refspec, check=False)
+                if self.has_commit(sha):
+                    break
+        if not self.has_commit(sha):
+            raise PullPalError(f"Commit {sha} not found in {self.clone_url}")
+
+    def changed_paths(self, old: str, new: str) -> Optional[Set[str]]:
+        """Paths that differ between two commits, or None when ``old`` is no longer in the mirror."""
+        if not self.has_commit(old):
+            return None
+        out = self._git("diff", "--name-only", "-z", "--no-renames", old, new).stdout
+        return {path for path in out.split("\0") if path}
+
+    def tree(self, sha: str) -> GitTreeSource:
+        if self._reader is None:
+            self._reader = CatFileReader(self.path)
+        return GitTreeSource(self._reader, sha)
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+def tree_for_metadata(metadata: Dict, root: Path = MIRROR_ROOT) -> Tuple[RepoMirror, GitTreeSource]:
+    """Make sure the PR head is in the shared mirror and return a view of its tree."""
+    mirror = RepoMirror.for_metadata(metadata, root)
+    head = metadata["head"]
+    mirror.ensure_commit(head["sha"], pr=metadata.get("number"), fallback_url=(head.get("repo") or {}).get("clone_url"))
+    return mirror, mirror.tree(head["sha"])
+
+
+def pr_heads(metadata: Dict) -> Dict[str, str]:
+    return {"head": metadata["head"]["sha"], "base": metadata["base"]["sha"]}
+
+
+def changed_since(metadata: Dict, previous: Dict[str, str], root: Path = MIRROR_ROOT) -> Optional[Set[str]]:
+    """Files whose diff, context or lints may differ from a run at the ``previous`` head/base SHAs.
+
+    Both the head and base ranges are diffed so a rebase onto a moved base is covered.
+    Returns None when the answer is unknown (no previous run, or its commits are gone)
+    and everything has to be reprocessed.
+    """
+    mirror = RepoMirror.for_metadata(metadata, root)
+    changed: Set[str] = set()
+    try:
+        with stage("git.changed_since") as record:
+            for key, sha in pr_heads(metadata).items():
+                old = previous.get(key)
+                if old == sha:
+                    continue
+                if not old:
+                    return None
+                pr = metadata.get("number") if key == "head" else None
+                mirror.ensure_commit(sha, pr=pr, fallback_url=(metadata[key].get("repo") or {}).get("clone_url"))
+                paths = mirror.changed_paths(old, sha)
+                if paths is None:
+                    return None
+                changed |= paths
+            record["files"] = len(changed)
+    finally:
+        mirror.close()
+    return changed
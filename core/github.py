@@ -0,0 +1,418 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .instrument import stage
+from .utils import DEFAULT_DATA_DIR, PullPalError, ensure_dir, github_headers
+
+
+API_ROOT = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+DEFAULT_HTTP_CACHE_DIR = DEFAULT_DATA_DIR / "cache" / "http"
+RETRY_STATUSES = {500, 502, 503, 504}
+# Methods safe to resend after a timeout or 5xx; others may already have taken effect.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+CACHED_HEADERS = ("Content-Type", "Link", "ETag", "Last-Modified")
+# Default for ``cache_dir``: resolved through http_cache_dir() when a client is created.
+_CACHE_FROM_ENV: Any = object()
+
+
+def http_cache_dir() -> Optional[Path]:
+    """``PULL_PAL_HTTP_CACHE`` when set (empty disables the cache), else the default under data/."""
+    cache_dir = os.getenv("PULL_PAL_HTTP_CACHE", str(DEFAULT_HTTP_CACHE_DIR))
+    return Path(cache_dir) if cache_dir else None
+
+
+def _unsent(exc: requests.RequestException) -> bool:
+    """True when the connection failed before any part of the request was sent."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(exc, requests.ConnectionError) and isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def _token_digest(headers: Mapping[str, str]) -> str:
+    # Responses may be private to a token, so the key covers the whole credential without storing it.
+    return hashlib.sha256(headers.get("Authorization", "").encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk store of GET responses for ``If-None-Match``/``If-Modified-Since`` revalidation."""
+
+    def __init__(self, root: Path):
+        self.root = ensure_dir(Path(root))
+
+    @staticmethod
+    def key(url: str, params: Optional[Mapping[str, Any]], headers: Mapping[str, str]) -> str:
+        material = json.dumps(
+            [url, sorted((params or {}).items()), headers.get("Accept"), _token_digest(headers)],
+            default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def load(self, key: str) -> Optional[Tuple[Dict[str, str], bytes]]:
+        meta_path = self.root / f"{key}.json"
+        body_path = self.root / f"{key}.body"
+        if not meta_path.exists() or not body_path.exists():
+            return None
+        with meta_path.open("r", encoding="utf-8") as fh:
+            return json.load(fh), body_path.read_bytes()
+
+    def store(self, key: str, headers: Mapping[str, str], body: bytes) -> None:
+        kept = {name: headers[name] for name in CACHED_HEADERS if name in headers}
+        if "ETag" not in kept and "Last-Modified" not in kept:
+            return
+        tmp_body = self.root / f"{key}.body.tmp"
+        tmp_body.write_bytes(body)
+        os.replace(tmp_body, self.root / f"{key}.body")
+        tmp_meta = self.root / f"{key}.json.tmp"
+        tmp_meta.write_text(json.dumps(kept), encoding="utf-8")
+        os.replace(tmp_meta, self.root / f"{key}.json")
+
+    @staticmethod
+    def conditional_headers(cached_headers: Mapping[str, str]) -> Dict[str, str]:
+        extra: Dict[str, str] = {}
+        if "ETag" in cached_headers:
+            extra["If-None-Match"] = cached_headers["ETag"]
+        if "Last-Modified" in cached_headers:
+            extra["If-Modified-Since"] = cached_headers["Last-Modified"]
+        return extra
+
+
+class RateLimiter:
+    """Tracks ``X-RateLimit-*`` headers and spreads the remaining quota over the window."""
+
+    def __init__(self, min_remaining: int = 50):
+        self.min_remaining = min_remaining
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        with self._lock:
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in headers:
+                self.reset_at = float(headers["X-RateLimit-Reset"])
+
+    def delay(self) -> float:
+        with self._lock:
+            if self.remaining is None or self.reset_at is None or self.remaining > self.min_remaining:
+                return 0.0
+            window = max(0.0, self.reset_at - time.time())
+            if self.remaining <= 0:
+                return window
+            return window / self.remaining
+
+
+class _GitHubBase:
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        *,
+        api_root: Optional[str] = None,
+        cache_dir: Optional[Path] = _CACHE_FROM_ENV,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        timeout: float = 30,
+        min_remaining: int = 50,
+    ):
+        self.token = token
+        self.api_root = (api_root or API_ROOT).rstrip("/")
+        if cache_dir is _CACHE_FROM_ENV:
+            cache_dir = http_cache_dir()
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.rate_limit = RateLimiter(min_remaining)
+
+    def url(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.api_root}/{path.lstrip('/')}"
+
+    @property
+    def graphql_url(self) -> str:
+        # GitHub Enterprise serves REST under /api/v3 and GraphQL under /api/graphql.
+        root = self.api_root[: -len("/v3")] if self.api_root.endswith("/api/v3") else self.api_root
+        return f"{root}/graphql"
+
+    def headers(self, accept: Optional[str] = None) -> Dict[str, str]:
+        headers = github_headers(self.token)
+        if accept:
+            headers["Accept"] = accept
+        return headers
+
+    def _retry_delay(self, status: int, headers: Mapping[str, str], attempt: int, retry: bool) -> Optional[float]:
+        """Return how long to wait before retrying, or ``None`` if the response is final.
+
+        Rate-limited requests were rejected unprocessed and are always retried; server
+        errors only when ``retry`` says the request is safe to resend.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if status in (403, 429):
+            if "Retry-After" in headers:
+                return float(headers["Retry-After"])
+            if headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in headers:
+                return max(0.0, float(headers["X-RateLimit-Reset"]) - time.time()) + 1.0
+            if status == 403:
+                return None
+        elif status not in RETRY_STATUSES or not retry:
+            return None
+        return self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+
+    def _prepare(
+        self, method: str, path: str, params: Optional[Mapping[str, Any]], accept: Optional[str], use_cache: bool
+    ) -> Tuple[str, Dict[str, str], Optional[str], Optional[Tuple[Dict[str, str], bytes]]]:
+        url = self.url(path)
+        headers = self.headers(accept)
+        key = cached = None
+        if method == "GET" and use_cache and self.cache is not None:
+            key = ResponseCache.key(url, params, headers)
+            cached = self.cache.load(key)
+            if cached is not None:
+                headers.update(ResponseCache.conditional_headers(cached[0]))
+        return url, headers, key, cached
+
+
+class GitHubClient(_GitHubBase):
+    """Pooled GitHub REST client with conditional requests, throttling and retries.
+
+    Revalidated responses (HTTP 304) do not count against the primary rate limit, so
+    repeated GETs of unchanged resources are served from the on-disk cache for free.
+    """
+
+    def __init__(self, token: Optional[str] = None, *, pool_size: int = 16, **kwargs: Any):
+        super().__init__(token, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Optional[Mapping[str, Any]] = None,
+        json: Any = None,
+        accept: Optional[str] = None,
+        use_cache: bool = True,
+        retry: Optional[bool] = None,
+    ) -> requests.Response:
+        with stage("github.request", method=method, path=path, revalidated=False) as record:
+            resp = self._request(record, method, path, params, json, accept, use_cache, retry)
+            record.update(status=resp.status_code, bytes=len(resp.content))
+            return resp
+
+    def _request(
+        self,
+        record: Dict[str, Any],
+        method: str,
+        path: str,
+        params: Optional[Mapping[str, Any]],
+        json: Any,
+        accept: Optional[str],
+        use_cache: bool,
+        retry: Optional[bool],
+    ) -> requests.Response:
+        url, headers, key, cached = self._prepare(method, path, params, accept, use_cache)
+        retry = method.upper() in IDEMPOTENT_METHODS if retry is None else retry
+        attempt = 0
+        while True:
+            record["attempts"] = attempt + 1
+            time.sleep(self.rate_limit.delay())
+            try:
+                resp = self.session.request(method, url, headers=headers, params=params, json=json, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if attempt >= self.max_retries or not (retry or _unsent(exc)):
+                    raise PullPalError(f"GitHub request to {url} failed: {exc}") from exc
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+                continue
+            self.rate_limit.update(resp.headers)
+            if resp.status_code == 304 and cached is not None:
+                record["revalidated"] = True
+                return _response_from_cache(url, *cached)
+            delay = None
+            if resp.status_code >= 400:
+                delay = self._retry_delay(resp.status_code, resp.headers, attempt, retry)
+            if delay is None:
+                break
+            time.sleep(delay)
+            attempt += 1
+        if resp.status_code >= 400:
+            raise PullPalError(f"GitHub request failed ({resp.status_code}): {resp.text}")
+        if key is not None:
+            self.cache.store(key, resp.headers, resp.content)
+        return resp
+
+    def get_json(self, path: str, *, params: Optional[Mapping[str, Any]] = None) -> Any:
+        return self.request("GET", path, params=params).json()
+
+    def get_binary(self, path: str, *, accept: Optional[str] = None) -> bytes:
+        return self.request("GET", path, accept=accept).content
+
+    def post_json(self, path: str, payload: Any, *, retry: bool = False) -> Any:
+        return self.request("POST", path, json=payload, retry=retry).json()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncGitHubClient(_GitHubBase):
+    """asyncio counterpart of :class:`GitHubClient` built on ``httpx``."""
+
+    def __init__(self, token: Optional[str] = None, *, max_connections: int = 16, **kwargs: Any):
+        super().__init__(token, **kwargs)
+        try:
+            import httpx
+        except ImportError as exc:  # pragma: no cover - optional dependency
+            raise PullPalError("AsyncGitHubClient requires httpx; pip install httpx") from exc
+        self._httpx = httpx
+        # Raised before any part of the request reached the server.
+        self._unsent_errors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Optional[Mapping[str, Any]] = None,
+        json: Any = None,
+        accept: Optional[str] = None,
+        use_cache: bool = True,
+        retry: Optional[bool] = None,
+    ):
+        with stage("github.request", method=method, path=path, revalidated=False) as record:
+            resp = await self._request(record, method, path, params, json, accept, use_cache, retry)
+            record.update(status=resp.status_code, bytes=len(resp.content))
+            return resp
+
+    async def _request(
+        self,
+        record: Dict[str, Any],
+        method: str,
+        path: str,
+        params: Optional[Mapping[str, Any]],
+        json: Any,
+        accept: Optional[str],
+        use_cache: bool,
+        retry: Optional[bool],
+    ):
+        url, headers, key, cached = self._prepare(method, path, params, accept, use_cache)
+        retry = method.upper() in IDEMPOTENT_METHODS if retry is None else retry
+        attempt = 0
+        while True:
+            record["attempts"] = attempt + 1
+            await asyncio.sleep(self.rate_limit.delay())
+            try:
+                resp = await self.client.request(method, url, headers=headers, params=params, json=json)
+            except self._httpx.TransportError as exc:
+                if attempt >= self.max_retries or not (retry or isinstance(exc, self._unsent_errors)):
+                    raise PullPalError(f"GitHub request to {url} failed: {exc}") from exc
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+                continue
+            self.rate_limit.update(resp.headers)
+            if resp.status_code == 304 and cached is not None:
+                record["revalidated"] = True
+                cached_headers, body = cached
+                return self._httpx.Response(200, headers=cached_headers, content=body, request=resp.request)
+            delay = None
+            if resp.status_code >= 400:
+                delay = self._retry_delay(resp.status_code, resp.headers, attempt, retry)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+            attempt += 1
+        if resp.status_code >= 400:
+            raise PullPalError(f"GitHub request failed ({resp.status_code}): {resp.text}")
+        if key is not None:
+            self.cache.store(key, resp.headers, resp.content)
+        return resp
+
+    async def get_json(self, path: str, *, params: Optional[Mapping[str, Any]] = None) -> Any:
+        return (await self.request("GET", path, params=params)).json()
+
+    async def get_binary(self, path: str, *, accept: Optional[str] = None) -> bytes:
+        return (await self.request("GET", path, accept=accept)).content
+
+    async def post_json(self, path: str, payload: Any, *, retry: bool = False) -> Any:
+        return (await self.request("POST", path, json=payload, retry=retry)).json()
+
+    async def graphql(
+        self,
+        query: str,
+        variables: Optional[Mapping[str, Any]] = None,
+        *,
+        allow_not_found: bool = False,
+        retry: bool = False,
+    ) -> Dict[str, Any]:
+        """Run a GraphQL query; any error fails it, except ``NOT_FOUND`` ones with ``allow_not_found``.
+
+        Tolerated ``NOT_FOUND`` errors leave the affected fields null in the returned data.
+
+        Pass ``retry=True`` for read-only queries so timeouts and server errors are retried.
+        """
+        body = {"query": query, "variables": dict(variables or {})}
+        payload = await self.post_json(self.graphql_url, body, retry=retry)
+        errors = [
+            error
+            for error in payload.get("errors") or []
+            if not (allow_not_found and error.get("type") == "NOT_FOUND")
+        ]
+        if errors or payload.get("data") is None:
+            raise PullPalError(f"GitHub GraphQL query failed: {payload.get('errors')}")
+        return payload["data"]
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncGitHubClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+
+def _response_from_cache(url: str, headers: Dict[str, str], body: bytes) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = url
+    resp.headers = CaseInsensitiveDict(headers)
+    resp._content = body
+    resp.encoding = "utf-8"
+    return resp
+
+
+_CLIENTS: Dict[Optional[str], GitHubClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(token: Optional[str] = None) -> GitHubClient:
+    """Return a process-wide client so connections are reused across helpers."""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(token)
+        if client is None:
+            client = GitHubClient(token)
+            _CLIENTS[token] = client
+    return client
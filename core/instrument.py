@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import argparse
+import contextvars
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_STACK: ContextVar[Tuple[str, ...]] = ContextVar("pull_pal_stage_stack", default=())
+_FIELDS: ContextVar[Dict[str, Any]] = ContextVar("pull_pal_stage_fields", default={})
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+class StageTracer:
+    """Writes one JSON line per finished stage: timings, memory and caller-supplied counts."""
+
+    def __init__(self, out: Optional[Path] = None):
+        self.out = out
+        self._lock = threading.Lock()
+        self._fh: IO[str] = sys.stderr if out is None else open(out, "a", encoding="utf-8", buffering=1)
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str, separators=(",", ":"))
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+
+    def close(self) -> None:
+        if self._fh is not sys.stderr:
+            self._fh.close()
+
+
+_TRACER: Optional[StageTracer] = None
+
+
+def configure(trace_path: Optional[str]) -> None:
+    """Enable stage tracing for this process; ``"-"`` writes records to stderr.
+
+    Also used as a ``ProcessPoolExecutor`` initializer so workers trace into the same file.
+    Forked workers inherit the forking thread's stage stack, so it is cleared here too.
+    """
+    global _TRACER
+    _STACK.set(())
+    _FIELDS.set({})
+    if _TRACER is not None:
+        _TRACER.close()
+        _TRACER = None
+    if trace_path:
+        _TRACER = StageTracer(None if trace_path == "-" else Path(trace_path))
+
+
+def trace_path() -> Optional[str]:
+    if _TRACER is None:
+        return None
+    return "-" if _TRACER.out is None else str(_TRACER.out)
+
+
+def enabled() -> bool:
+    return _TRACER is not None
+
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap ``fn`` to run in a copy of the caller's context, for thread pool workers."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+@contextmanager
+def context(**fields: Any) -> Iterator[None]:
+    """Attach ``fields`` (e.g. ``pr="owner/repo#12"``) to every stage recorded inside the block."""
+    token = _FIELDS.set({**_FIELDS.get(), **fields})
+    try:
+        yield
+    finally:
+        _FIELDS.reset(token)
+
+
+@contextmanager
+def stage(name: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """Time a block and emit a record for it when tracing is enabled.
+
+    The yielded dict starts as ``fields``; callers add counts (``bytes``, ``files``...)
+    to it as they become known. It is a plain throwaway dict when tracing is off.
+    """
+    tracer = _TRACER
+    if tracer is None:
+        yield dict(fields)
+        return
+    parents = _STACK.get()
+    token = _STACK.set(parents + (name,))
+    record: Dict[str, Any] = dict(fields)
+    rss_start = rss_mb()
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    error: Optional[str] = None
+    try:
+        yield record
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        _STACK.reset(token)
+        rss_end = rss_mb()
+        tracer.emit(
+            {
+                "stage": name,
+                "parent": parents[-1] if parents else None,
+                **_FIELDS.get(),
+                **record,
+                "seconds": round(seconds, 6),
+                "cpu_seconds": round(time.process_time() - cpu_start, 6),
+                "rss_mb": round(rss_end, 2),
+                "rss_delta_mb": round(rss_end - rss_start, 2),
+                "peak_rss_mb": round(max(peak_rss_mb(), rss_end), 2),
+                "pid": os.getpid(),
+                "thread": threading.current_thread().name,
+                "error": error,
+                "ts": round(time.time(), 3),
+            }
+        )
+
+
+class SamplingProfiler:
+    """Low-overhead statistical profiler that records collapsed stacks of every thread.
+
+    Output is one ``frame;frame;frame count`` line per distinct stack, the format read
+    by flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pull-pal-sampler", daemon=True)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{Path(code.co_filename).name}:{code.co_name}:{code.co_firstlineno}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                self.samples[";".join([names.get(ident, str(ident)), *reversed(stack)])] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, out: Path) -> None:
+        self._stop.set()
+        self._thread.join()
+        with open(out, "w", encoding="utf-8") as fh:
+            for stack, count in self.samples.most_common():
+                fh.write(f"{stack} {count}\n")
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("instrumentation")
+    group.add_argument("--profile", type=Path, default=None, help="Write a profile of this run to PATH.")
+    group.add_argument(
+        "--profile-mode",
+        choices=PROFILE_MODES,
+        default="cprofile",
+        help="cprofile writes pstats data; sampling writes collapsed stacks for flame graphs.",
+    )
+    group.add_argument(
+        "--trace-stages",
+        nargs="?",
+        const="-",
+        default=None,
+        metavar="PATH",
+        help="Append one JSON record per pipeline stage to PATH (stderr if omitted).",
+    )
+
+
+@contextmanager
+def session(args: argparse.Namespace, script: str, **fields: Any) -> Iterator[None]:
+    """Apply ``--profile``/``--trace-stages`` around a script's main body."""
+    configure(getattr(args, "trace_stages", None))
+    profile_path: Optional[Path] = getattr(args, "profile", None)
+    profiler: Any = None
+    if profile_path is not None:
+        profile_path.parent.mkdir(parents=True, exist_ok=True)
+        profiler = SamplingProfiler() if args.profile_mode == "sampling" else cProfile.Profile()
+        if isinstance(profiler, SamplingProfiler):
+            profiler.start()
+        else:
+            profiler.enable()
+    try:
+        with context(script=script, **{key: val for key, val in fields.items() if val is not None}):
+            with stage(script):
+                yield
+    finally:
+        if isinstance(profiler, SamplingProfiler):
+            profiler.stop(profile_path)
+        elif profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(str(profile_path))
+        if profiler is not None:
+            print(f"Wrote {args.profile_mode} profile to {profile_path}", file=sys.stderr)
+        configure(None)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Sequence
+
+
+MAX_SOURCE_LENGTH = 512
+INSTRUCTION = "Provide a concise, constructive code review comment."
+HUNK_CACHE_SIZE = 4096
+# Tokens left to the lint and context sections (label included) when they must be shortened.
+SECTION_FLOOR = 8
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@")
+
+
+def context_text(context: Optional[Dict]) -> str:
+    context = context or {}
+    bits = [context.get("symbol_type"), context.get("symbol"), context.get("signature")]
+    return " | ".join(bit for bit in bits if bit) or "N/A"
+
+
+def lint_text(lint: Optional[List[Dict]]) -> str:
+    return " | ".join(f"{item['code']}:{item['message']}" for item in lint or []) or "none"
+
+
+def target_index(lines: Sequence[str], line: Optional[int], given: Optional[int] = None) -> int:
+    """Position of the commented line within the hunk ``lines``.
+
+    build_examples records it as ``target_index``. Without it, a hunk that starts with an
+    ``@@`` header is walked to find ``line``; otherwise the last line is used, since that is
+    where GitHub's ``diff_hunk`` for a review comment ends.
+    """
+    if given is not None and 0 <= given < len(lines):
+        return given
+    header = _HUNK_HEADER.match(lines[0]) if lines else None
+    if header and line is not None:
+        current = int(header.group(1))
+        for pos, text in enumerate(lines[1:], 1):
+            if text.startswith(("-", "\\")):
+                continue
+            if current == line:
+                return pos
+            current += 1
+    return max(len(lines) - 1, 0)
+
+
+class PromptBuilder:
+    """Encoder input IDs for review prompts, kept within ``max_length`` tokens.
+
+    Each section is tokenized on its own. A prompt over budget loses diff lines first,
+    keeping a window around the target line; the context and lint sections are only
+    shortened when the target line alone does not fit next to them.
+    """
+
+    def __init__(self, tokenizer, max_length: int = MAX_SOURCE_LENGTH, cache_size: int = HUNK_CACHE_SIZE):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.budget = max_length - tokenizer.num_special_tokens_to_add(pair=False)
+        self.cache_size = cache_size
+        self._instruction = self._encode([INSTRUCTION])[0]
+        self._hunks: Dict[str, List[List[int]]] = {}
+
+    def _encode(self, texts: List[str]) -> List[List[int]]:
+        return self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+
+    def hunk_tokens(self, hunk: str) -> List[List[int]]:
+        """Token IDs of each hunk line, newline included; cached by hunk text."""
+        cached = self._hunks.get(hunk)
+        if cached is None:
+            if len(self._hunks) >= self.cache_size:
+                self._hunks.clear()
+            cached = self._hunks[hunk] = self._encode([f"{text}\n" for text in hunk.split("\n")])
+        return cached
+
+    def build(self, example: Dict) -> List[int]:
+        hunk = example.get("diff_hunk") or ""
+        lines = self.hunk_tokens(hunk)
+        target = target_index(hunk.split("\n"), example.get("line"), example.get("target_index"))
+        header, context, lint = self._encode(
+            [
+                f"File: {example.get('path')} (line {example.get('line')})\nDiff:\n",
+                f"Context: {context_text(example.get('context'))}\n",
+                f"Lint: {lint_text(example.get('lint'))}\n",
+            ]
+        )
+        target_ids = lines[target]
+        fixed = len(header) + len(self._instruction)
+        # Only prompts whose sections leave no room for the target line are cut here:
+        # lint first, then context, then the target line itself.
+        overflow = fixed + len(context) + len(lint) + len(target_ids) - self.budget
+        if overflow > 0:
+            keep = max(len(lint) - overflow, min(len(lint), SECTION_FLOOR))
+            overflow -= len(lint) - keep
+            lint = lint[:keep]
+        if overflow > 0:
+            keep = max(len(context) - overflow, min(len(context), SECTION_FLOOR))
+            overflow -= len(context) - keep
+            context = context[:keep]
+        if overflow > 0:
+            target_ids = target_ids[: max(len(target_ids) - overflow, 0)]
+
+        # Grow the window one line at a time on each side while the lines still fit.
+        room = self.budget - (fixed + len(context) + len(lint) + len(target_ids))
+        start, end = target, target + 1
+        grow_before, grow_after = True, True
+        while grow_before or grow_after:
+            grow_before = grow_before and start > 0 and len(lines[start - 1]) <= room
+            if grow_before:
+                start -= 1
+                room -= len(lines[start])
+            grow_after = grow_after and end < len(lines) and len(lines[end]) <= room
+            if grow_after:
+                room -= len(lines[end])
+                end += 1
+
+        ids = list(header)
+        for line_ids in lines[start:target]:
+            ids.extend(line_ids)
+        ids.extend(target_ids)
+        for line_ids in lines[target + 1 : end]:
+            ids.extend(line_ids)
+        ids.extend(context)
+        ids.extend(lint)
+        ids.extend(self._instruction)
+        return self.tokenizer.build_inputs_with_special_tokens(ids[: self.budget])
+
+    def build_batch(self, examples: Sequence[Dict]) -> List[List[int]]:
+        return [self.build(example) for example in examples]
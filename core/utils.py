@@ -1,23 +1,28 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 import subprocess
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set
 
-import requests
+from .instrument import stage
 
 
 DEFAULT_DATA_DIR = Path("data")
+# Format for per-file pipeline artifacts (diff_summary, diff_full, diff_with_ctx, diff_with_lint).
+ARTIFACT_FORMAT = os.getenv("PULL_PAL_ARTIFACT_FORMAT", "arrow")
+ARROW_BATCH_FILES = 256
 
 
 class PullPalError(RuntimeError):
     """Base exception for domain specific failures."""
 
 
-@dataclass
+@dataclass(frozen=True)
 class RepoRef:
     owner: str
     repo: str
@@ -34,6 +39,32 @@ class RepoRef:
         return DEFAULT_DATA_DIR / "raw" / self.slug / f"pr_{self.pr}"
 
 
+def parse_pr_refs(specs: Sequence[str]) -> List[RepoRef]:
+    """Parse ``owner/repo#123`` or ``owner/repo#100-200`` specs."""
+    refs: List[RepoRef] = []
+    for spec in specs:
+        spec = spec.strip()
+        if not spec or spec.startswith("#"):
+            continue
+        try:
+            slug, numbers = spec.split("#", 1)
+            owner, repo = slug.split("/", 1)
+            start, _, end = numbers.partition("-")
+            for pr in range(int(start), int(end or start) + 1):
+                refs.append(RepoRef(owner, repo, pr))
+        except ValueError as exc:
+            raise PullPalError(f"Invalid PR spec {spec!r}; expected owner/repo#N or owner/repo#N-M") from exc
+    return refs
+
+
+def pr_label(metadata: Dict[str, Any]) -> Optional[str]:
+    """``owner/repo#N`` for a PR's metadata.json, used to tag trace records."""
+    base_repo = (metadata.get("base") or {}).get("repo") or {}
+    if "full_name" not in base_repo or "number" not in metadata:
+        return None
+    return f"{base_repo['full_name']}#{metadata['number']}"
+
+
 def getenv_token() -> str:
     token = os.getenv("GITHUB_TOKEN")
     if not token:
@@ -47,33 +78,224 @@ def ensure_dir(path: Path) -> Path:
 
 
 def load_json(path: Path) -> Any:
-    with path.open("r", encoding="utf-8") as fh:
+    with stage("json.load", path=path.name, bytes=path.stat().st_size), path.open("r", encoding="utf-8") as fh:
         return json.load(fh)
 
 
+def _atomic_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+
 def dump_json(payload: Any, path: Path) -> None:
-    ensure_dir(path.parent)
-    with path.open("w", encoding="utf-8") as fh:
-        json.dump(payload, fh, indent=2, sort_keys=True)
+    with stage("json.dump", path=path.name) as record:
+        ensure_dir(path.parent)
+        tmp_path = _atomic_path(path)
+        with tmp_path.open("w", encoding="utf-8") as fh:
+            json.dump(payload, fh, indent=2, sort_keys=True)
+        record["bytes"] = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
 
 
 def dump_jsonl(records: Iterable[Dict[str, Any]], path: Path) -> None:
-    ensure_dir(path.parent)
-    with path.open("w", encoding="utf-8") as fh:
-        for row in records:
-            fh.write(json.dumps(row))
-            fh.write("\n")
+    with stage("jsonl.dump", path=path.name) as record:
+        ensure_dir(path.parent)
+        tmp_path = _atomic_path(path)
+        rows = 0
+        with tmp_path.open("w", encoding="utf-8") as fh:
+            for row in records:
+                fh.write(json.dumps(row))
+                fh.write("\n")
+                rows += 1
+        record.update(bytes=tmp_path.stat().st_size, records=rows)
+        os.replace(tmp_path, path)
+
+
+def iter_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """Stream records from a JSONL file one line at a time."""
+    with stage("jsonl.iter", path=path.name, bytes=path.stat().st_size) as record:
+        rows = 0
+        with path.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    rows += 1
+                    yield json.loads(line)
+        record["records"] = rows
+
+
+def write_bytes(payload: bytes, path: Path) -> None:
+    with stage("file.write", path=path.name, bytes=len(payload)):
+        ensure_dir(path.parent)
+        tmp_path = _atomic_path(path)
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, path)
+
+
+class ArtifactFormat(ABC):
+    """Reads and writes ``{"files": [...]}`` artifacts stored with one file ``suffix``."""
+
+    suffix = ""
+
+    @abstractmethod
+    def dump(self, payload: Dict[str, Any], path: Path) -> None:
+        ...
+
+    @abstractmethod
+    def load(self, path: Path, paths: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """Load the artifact, keeping only records whose ``path`` is in ``paths`` when given."""
+
+
+class JsonFormat(ArtifactFormat):
+    suffix = ".json"
+
+    def dump(self, payload: Dict[str, Any], path: Path) -> None:
+        dump_json(payload, path)
+
+    def load(self, path: Path, paths: Optional[Set[str]] = None) -> Dict[str, Any]:
+        payload = load_json(path)
+        if paths is not None:
+            payload["files"] = [entry for entry in payload["files"] if entry["path"] in paths]
+        return payload
+
+
+class JsonlFormat(ArtifactFormat):
+    """One file record per line, as written by ``diff_parser --stream``.
+
+    Top-level keys other than ``files`` are not stored.
+    """
+
+    suffix = ".jsonl"
+
+    def dump(self, payload: Dict[str, Any], path: Path) -> None:
+        dump_jsonl(payload["files"], path)
+
+    def load(self, path: Path, paths: Optional[Set[str]] = None) -> Dict[str, Any]:
+        with stage("jsonl.load", path=path.name, bytes=path.stat().st_size) as record:
+            with path.open("r", encoding="utf-8") as fh:
+                files = [json.loads(line) for line in fh if line.strip()]
+            if paths is not None:
+                files = [entry for entry in files if entry["path"] in paths]
+            record["files"] = len(files)
+            return {"files": files}
+
+
+class ArrowFormat(ArtifactFormat):
+    """Arrow IPC file with one row per changed file and nested columns for hunks, contexts and lints.
+
+    Reads memory-map the file and materialise only the selected rows as Python objects.
+    """
+
+    suffix = ".arrow"
+    METADATA_KEY = b"pull_pal"
+
+    @staticmethod
+    def _pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.compute  # noqa: F401
+            import pyarrow.ipc  # noqa: F401
+        except ImportError as exc:  # pragma: no cover - optional dependency
+            raise PullPalError(
+                "Arrow artifacts require pyarrow; pip install pyarrow or set PULL_PAL_ARTIFACT_FORMAT=json"
+            ) from exc
+        return pyarrow
+
+    def dump(self, payload: Dict[str, Any], path: Path) -> None:
+        pa = self._pyarrow()
+        files = payload["files"]
+        with stage("arrow.dump", path=path.name, files=len(files)) as record:
+            if files:
+                table = pa.Table.from_batches([pa.RecordBatch.from_struct_array(pa.array(files))])
+            else:
+                table = pa.table({"path": pa.array([], pa.string())})
+            extra = {key: value for key, value in payload.items() if key != "files"}
+            table = table.replace_schema_metadata({self.METADATA_KEY: json.dumps(extra).encode("utf-8")})
+            ensure_dir(path.parent)
+            tmp_path = _atomic_path(path)
+            with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=ARROW_BATCH_FILES)
+            record["bytes"] = tmp_path.stat().st_size
+            os.replace(tmp_path, path)
+
+    def load(self, path: Path, paths: Optional[Set[str]] = None) -> Dict[str, Any]:
+        pa = self._pyarrow()
+        with stage("arrow.load", path=path.name, bytes=path.stat().st_size) as record:
+            with pa.memory_map(str(path), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+                if paths is not None:
+                    selected = pa.array(sorted(paths), pa.string())
+                    table = table.filter(pa.compute.is_in(table["path"], value_set=selected))
+                files = table.to_pylist()
+            record["files"] = len(files)
+        metadata = table.schema.metadata or {}
+        extra = json.loads(metadata.get(self.METADATA_KEY, b"{}"))
+        return {**extra, "files": files}
+
+
+ARTIFACT_FORMATS: Dict[str, ArtifactFormat] = {
+    "json": JsonFormat(),
+    "jsonl": JsonlFormat(),
+    "arrow": ArrowFormat(),
+}
+
+
+def _format_for(path: Path) -> ArtifactFormat:
+    for fmt in ARTIFACT_FORMATS.values():
+        if path.suffix == fmt.suffix:
+            return fmt
+    raise PullPalError(f"Unknown artifact format for {path}; expected one of {', '.join(ARTIFACT_FORMATS)}")
+
+
+def artifact_suffix(fmt: Optional[str] = None) -> str:
+    """File suffix for ``fmt`` (defaults to ``PULL_PAL_ARTIFACT_FORMAT``)."""
+    fmt = fmt or ARTIFACT_FORMAT
+    if fmt not in ARTIFACT_FORMATS:
+        raise PullPalError(f"Unknown artifact format {fmt!r}; expected one of {', '.join(ARTIFACT_FORMATS)}")
+    return ARTIFACT_FORMATS[fmt].suffix
+
+
+def artifact_path(directory: Path, stem: str, fmt: Optional[str] = None) -> Path:
+    return Path(directory) / f"{stem}{artifact_suffix(fmt)}"
+
+
+def find_artifact(directory: Path, stem: str) -> Path:
+    """Existing artifact ``stem`` in any format, preferring the default one."""
+    for fmt in dict.fromkeys([ARTIFACT_FORMAT, *ARTIFACT_FORMATS]):
+        candidate = artifact_path(directory, stem, fmt)
+        if candidate.exists():
+            return candidate
+    return artifact_path(directory, stem)
+
+
+def load_files(path: Path, paths: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Load a ``{"files": [...]}`` artifact in the format given by its suffix."""
+    return _format_for(path).load(path, set(paths) if paths is not None else None)
+
+
+def dump_files(payload: Dict[str, Any], path: Path) -> None:
+    _format_for(path).dump(payload, path)
+
+
+def previous_files(path: Path, changed: Optional[Set[str]]) -> Dict[str, Dict[str, Any]]:
+    """Records of an earlier run of an artifact, by path, for files outside ``changed``.
+
+    Empty when ``changed`` is None (full run) or the artifact does not exist yet.
+    """
+    if changed is None or not path.exists():
+        return {}
+    return {entry["path"]: entry for entry in load_files(path)["files"] if entry["path"] not in changed}
 
 
 def run(cmd: List[str], *, cwd: Optional[Path] = None, check: bool = True) -> subprocess.CompletedProcess:
-    proc = subprocess.run(
-        cmd,
-        cwd=cwd,
-        check=False,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
+    with stage("exec", program=Path(cmd[0]).name, command=" ".join(cmd[1:6])[:120]) as record:
+        proc = subprocess.run(
+            cmd,
+            cwd=cwd,
+            check=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        record.update(returncode=proc.returncode, bytes=len(proc.stdout))
     if check and proc.returncode != 0:
         raise PullPalError(f"Command {' '.join(cmd)} failed: {proc.stderr.strip()}")
     return proc
@@ -90,17 +312,15 @@ def github_headers(token: Optional[str] = None) -> Dict[str, str]:
 
 
 def github_get(url: str, *, params: Optional[Dict[str, Any]] = None, token: Optional[str] = None) -> Dict[str, Any]:
-    resp = requests.get(url, headers=github_headers(token), params=params, timeout=30)
-    if resp.status_code >= 400:
-        raise PullPalError(f"GitHub request failed ({resp.status_code}): {resp.text}")
-    return resp.json()
+    from .github import get_client
+
+    return get_client(token).get_json(url, params=params)
 
 
 def github_get_binary(url: str, *, token: Optional[str] = None) -> bytes:
-    resp = requests.get(url, headers=github_headers(token), timeout=30)
-    if resp.status_code >= 400:
-        raise PullPalError(f"GitHub request failed ({resp.status_code}): {resp.text}")
-    return resp.content
+    from .github import get_client
+
+    return get_client(token).get_binary(url)
 
 
 def read_patch(path: Path) -> str:
@@ -114,3 +334,10 @@ def chunk_list(items: List[Any], size: int) -> List[List[Any]]:
 
 def filter_python_files(paths: Iterable[str]) -> List[str]:
     return [p for p in paths if p.endswith(".py")]
+
+
+def git_blob_sha(data: bytes) -> str:
+    """Return the SHA git would assign to ``data`` as a blob object."""
+    digest = hashlib.sha1(b"blob %d\0" % len(data))
+    digest.update(data)
+    return digest.hexdigest()
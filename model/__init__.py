@@ -1,3 +1,4 @@
 """Inference helpers and FastAPI surface for Pull Pal."""
 
 from .inference import ReviewModel, get_model  # noqa: F401
+from .batching import BatchScheduler, get_scheduler  # noqa: F401
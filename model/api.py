@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Literal, Optional
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
 
-from .inference import get_model
+from .batching import get_scheduler
+from .cache import get_response_cache
+from .metrics import IN_FLIGHT, REGISTRY, worker_id
 
 
 class ContextPayload(BaseModel):
@@ -23,28 +28,124 @@ class LintPayload(BaseModel):
     line: Optional[int] = None
 
 
+DecodingProfileName = Literal["greedy", "small_beam", "full_beam"]
+REQUEST_OPTIONS = {"use_cache", "profile", "latency_budget_ms"}
+
+
 class ReviewRequest(BaseModel):
     path: str
     line: int
     diff_hunk: str
+    target_index: Optional[int] = None
     context: Optional[ContextPayload] = None
     lint: Optional[List[LintPayload]] = None
+    use_cache: bool = True
+    profile: Optional[DecodingProfileName] = None
+    latency_budget_ms: Optional[float] = Field(default=None, gt=0)
 
 
 class ReviewResponse(BaseModel):
     comment: str
 
 
+class BatchReviewRequest(BaseModel):
+    items: List[ReviewRequest]
+    use_cache: bool = True
+    profile: Optional[DecodingProfileName] = None
+    latency_budget_ms: Optional[float] = Field(default=None, gt=0)
+
+
+class BatchReviewResponse(BaseModel):
+    results: List[ReviewResponse]
+
+
+TIMING_HEADER = "X-Pull-Pal-Timing"
+
 app = FastAPI(title="Pull Pal API", version="0.1.0")
 
 
+@contextmanager
+def _in_flight() -> Iterator[None]:
+    IN_FLIGHT.inc()
+    try:
+        yield
+    finally:
+        IN_FLIGHT.dec()
+
+
+def _wants_timing(request: Request) -> bool:
+    return request.headers.get(TIMING_HEADER, "").lower() in ("1", "true", "yes")
+
+
+def _server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+
+
 @app.get("/health")
 def health() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/decoding/costs")
+def decoding_costs() -> dict:
+    costs = get_scheduler(Path("model/checkpoints/final")).model.costs.snapshot()
+    return {"worker": worker_id(), "seconds_per_step": costs}
+
+
+@app.get("/cache/stats")
+def cache_stats() -> dict:
+    return {"worker": worker_id(), **get_response_cache().stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/review", response_model=ReviewResponse)
-def review(payload: ReviewRequest) -> ReviewResponse:
-    model = get_model(Path("model/checkpoints/final"))
-    comment = model.generate_comment(payload.model_dump())
+def review(payload: ReviewRequest, request: Request, response: Response) -> ReviewResponse:
+    started = time.perf_counter()
+    timings: Optional[Dict[str, float]] = {} if _wants_timing(request) else None
+    scheduler = get_scheduler(Path("model/checkpoints/final"))
+    with _in_flight():
+        comment = scheduler.review(
+            payload.model_dump(exclude=REQUEST_OPTIONS),
+            use_cache=payload.use_cache,
+            profile=payload.profile,
+            latency_budget_ms=payload.latency_budget_ms,
+            timings=timings,
+        )
+    if timings is not None:
+        timings["total"] = time.perf_counter() - started
+        response.headers["Server-Timing"] = _server_timing(timings)
     return ReviewResponse(comment=comment)
+
+
+@app.post("/review/batch", response_model=BatchReviewResponse)
+def review_batch(payload: BatchReviewRequest, request: Request, response: Response) -> BatchReviewResponse:
+    started = time.perf_counter()
+    item_timings: List[Optional[Dict[str, float]]] = [
+        {} if _wants_timing(request) else None for _ in payload.items
+    ]
+    scheduler = get_scheduler(Path("model/checkpoints/final"))
+    with _in_flight():
+        futures = [
+            scheduler.submit(
+                item.model_dump(exclude=REQUEST_OPTIONS),
+                use_cache=payload.use_cache and item.use_cache,
+                profile=item.profile or payload.profile,
+                latency_budget_ms=item.latency_budget_ms or payload.latency_budget_ms,
+                timings=timings,
+            )
+            for item, timings in zip(payload.items, item_timings)
+        ]
+        comments = [future.result() for future in futures]
+    if _wants_timing(request):
+        # Items may span several model batches; report the slowest item per stage.
+        merged: Dict[str, float] = {}
+        for timings in item_timings:
+            for stage, seconds in timings.items():
+                merged[stage] = max(merged.get(stage, 0.0), seconds)
+        merged["total"] = time.perf_counter() - started
+        response.headers["Server-Timing"] = _server_timing(merged)
+    return BatchReviewResponse(results=[ReviewResponse(comment=comment) for comment in comments])
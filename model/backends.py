@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import difflib
+from pathlib import Path
+from typing import Dict, List
+
+import torch
+from transformers import EncoderDecoderConfig, EncoderDecoderModel
+
+from core.utils import PullPalError, ensure_dir
+
+
+BACKENDS = ("fp32", "int8", "onnx")
+INT8_WEIGHTS = "pytorch_model_int8.bin"
+
+
+def backend_dir(model_dir: Path, backend: str) -> Path:
+    return Path(model_dir) if backend == "fp32" else Path(model_dir) / backend
+
+
+def quantize_int8(model: EncoderDecoderModel) -> EncoderDecoderModel:
+    """Dynamic int8 quantization of every Linear layer; activations stay fp32."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_int8(model_dir: Path) -> Path:
+    out_dir = ensure_dir(backend_dir(model_dir, "int8"))
+    model = EncoderDecoderModel.from_pretrained(model_dir).eval()
+    torch.save(quantize_int8(model).state_dict(), out_dir / INT8_WEIGHTS)
+    return out_dir
+
+
+def export_onnx(model_dir: Path) -> Path:
+    ORTModelForSeq2SeqLM = _ort_model_class()
+    out_dir = ensure_dir(backend_dir(model_dir, "onnx"))
+    ORTModelForSeq2SeqLM.from_pretrained(model_dir, export=True).save_pretrained(out_dir)
+    return out_dir
+
+
+EXPORTERS = {"int8": export_int8, "onnx": export_onnx}
+
+
+def load_backend(model_dir: Path, backend: str):
+    """Load the generation model for ``backend`` from a checkpoint directory."""
+    if backend not in BACKENDS:
+        raise PullPalError(f"Unknown backend {backend!r}; choose one of {', '.join(BACKENDS)}")
+    model_dir = Path(model_dir)
+    if backend == "fp32":
+        return EncoderDecoderModel.from_pretrained(model_dir).eval()
+    converted = backend_dir(model_dir, backend)
+    if not converted.exists():
+        raise PullPalError(
+            f"No {backend} export in {converted}; run scripts/export_model.py --model-dir {model_dir} --backend {backend}"
+        )
+    if backend == "int8":
+        skeleton = EncoderDecoderModel(config=EncoderDecoderConfig.from_pretrained(model_dir)).eval()
+        model = quantize_int8(skeleton)
+        model.load_state_dict(torch.load(converted / INT8_WEIGHTS, map_location="cpu"))
+        return model
+    return _ort_model_class().from_pretrained(converted)
+
+
+def _ort_model_class():
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise PullPalError("The onnx backend requires optimum[onnxruntime]; pip install 'optimum[onnxruntime]'") from exc
+    return ORTModelForSeq2SeqLM
+
+
+def parity_report(reference: List[str], candidate: List[str]) -> Dict[str, float]:
+    """Compare comments generated by two backends for the same prompts."""
+    if not reference:
+        return {"count": 0, "exact_match": 1.0, "token_similarity": 1.0}
+    exact = sum(ref == cand for ref, cand in zip(reference, candidate))
+    similarity = sum(
+        difflib.SequenceMatcher(a=ref.split(), b=cand.split()).ratio() for ref, cand in zip(reference, candidate)
+    )
+    return {
+        "count": len(reference),
+        "exact_match": exact / len(reference),
+        "token_similarity": similarity / len(reference),
+    }
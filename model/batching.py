@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from .cache import ResponseCache, get_response_cache
+from .decoding import DecodingProfile, resolve_profile
+from .inference import ReviewModel, get_model
+from .metrics import STAGE_SECONDS
+
+
+@dataclass
+class _Pending:
+    payload: Dict
+    profile: DecodingProfile
+    deadline: Optional[float] = None
+    cache_key: Optional[str] = None
+    input_ids: Optional[List[int]] = None
+    encode_seconds: float = 0.0
+    timings: Optional[Dict[str, float]] = None
+    enqueued: float = field(default_factory=time.monotonic)
+    future: Future = field(default_factory=Future)
+
+    @property
+    def batch_key(self):
+        # Deadline-bound requests never share a batch with unbounded ones, which
+        # would otherwise inherit the deadline and come back truncated.
+        return self.profile, self.deadline is not None
+
+
+class BatchScheduler:
+    """Coalesces concurrent review requests into batched ``generate`` calls.
+
+    Requests are queued and a single worker thread drains up to ``max_batch_size``
+    of them, waiting at most ``max_wait_ms`` after the first arrival, before running
+    one padded forward pass and resolving each caller's future. Only requests that
+    share a decoding profile (and deadline-ness) are batched together.
+    """
+
+    def __init__(
+        self,
+        model: ReviewModel,
+        *,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.model = model
+        self.cache = cache
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._backlog: Deque[_Pending] = deque()
+        self._worker = threading.Thread(target=self._run, name="pull-pal-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(
+        self,
+        payload: Dict,
+        *,
+        use_cache: bool = True,
+        profile: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Future:
+        """Queue ``payload``; cached comments resolve immediately without queueing.
+
+        With a latency budget, the strongest profile whose estimated decode time
+        fits the budget (minus the batching window) is used, and decoding stops
+        at the deadline. ``timings`` is filled with per-stage seconds for this
+        request once its future resolves.
+        """
+        budget = latency_budget_ms / 1000.0 if latency_budget_ms is not None else None
+        chosen = resolve_profile(self.model.costs, profile, None if budget is None else budget - self.max_wait)
+        # The prompt is built once here: it keys the cache and is what the worker pads.
+        encode_started = time.perf_counter()
+        input_ids = self.model.encode(payload)
+        encode_seconds = time.perf_counter() - encode_started
+        key = None
+        if self.cache is not None and use_cache:
+            lookup_started = time.perf_counter()
+            key = self.model.cache_key(input_ids, chosen)
+            cached = self.cache.get(key)
+            if timings is not None:
+                timings["cache"] = time.perf_counter() - lookup_started
+            if cached is not None:
+                future: Future = Future()
+                future.set_result(cached)
+                return future
+        deadline = time.monotonic() + budget if budget is not None else None
+        pending = _Pending(payload, chosen, deadline, key, input_ids, encode_seconds, timings)
+        self._queue.put(pending)
+        return pending.future
+
+    def review(self, payload: Dict, *, timeout: Optional[float] = None, **options) -> str:
+        return self.submit(payload, **options).result(timeout)
+
+    def review_many(self, payloads: List[Dict], *, timeout: Optional[float] = None, **options) -> List[str]:
+        futures = [self.submit(payload, **options) for payload in payloads]
+        return [future.result(timeout) for future in futures]
+
+    def _next(self, timeout: Optional[float]) -> Optional[_Pending]:
+        if self._backlog:
+            return self._backlog.popleft()
+        try:
+            if timeout is None:
+                return self._queue.get()
+            return self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _collect(self) -> List[_Pending]:
+        first = self._next(None)
+        batch = [first]
+        deferred: List[_Pending] = []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            pending = self._next(deadline - time.monotonic())
+            if pending is None:
+                break
+            (batch if pending.batch_key == first.batch_key else deferred).append(pending)
+        self._backlog.extendleft(reversed(deferred))
+        return [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self._process(batch)
+            except Exception as exc:  # fail the batch's waiting callers, never the worker thread
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(exc)
+
+    def _process(self, batch: List[_Pending]) -> None:
+        deadlines = [pending.deadline for pending in batch if pending.deadline is not None]
+        max_time = min(deadlines) - time.monotonic() if deadlines else None
+        started = time.monotonic()
+        for pending in batch:
+            STAGE_SECONDS.observe(started - pending.enqueued, stage="queue")
+            if pending.timings is not None:
+                pending.timings["queue"] = started - pending.enqueued
+        batch_timings: Dict[str, float] = {}
+        comments = self.model.generate_comments(
+            [pending.payload for pending in batch],
+            input_ids=[pending.input_ids for pending in batch],
+            encode_seconds=sum(pending.encode_seconds for pending in batch),
+            profile=batch[0].profile,
+            max_time=max_time,
+            timings=batch_timings,
+        )
+        # Output cut short by the deadline is returned but never cached.
+        truncated = max_time is not None and time.monotonic() - started >= max_time
+        for pending, comment in zip(batch, comments):
+            if self.cache is not None and pending.cache_key is not None and not truncated:
+                self.cache.put(pending.cache_key, comment)
+            if pending.timings is not None:
+                pending.timings.update(batch_timings)
+            pending.future.set_result(comment)
+
+
+_SCHEDULER: Optional[BatchScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler(model_dir=None) -> BatchScheduler:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = BatchScheduler(
+                get_model(model_dir),
+                max_batch_size=int(os.getenv("PULL_PAL_MAX_BATCH_SIZE", "8")),
+                max_wait_ms=float(os.getenv("PULL_PAL_BATCH_WAIT_MS", "10")),
+                cache=get_response_cache(),
+            )
+    return _SCHEDULER
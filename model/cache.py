@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from core.cache import BlobCache
+
+
+def response_key(input_ids: Sequence[int], params: Dict[str, Any], model_id: str) -> str:
+    """Keyed on the encoder input IDs, so requests that trim to the same prompt share an entry."""
+    material = json.dumps([list(input_ids), sorted(params.items()), model_id], default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Generated comments keyed by prompt hash, with an in-memory LRU and optional disk tier."""
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 86400.0, disk_path: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._disk = BlobCache(disk_path, namespace="review_comments:v2") if disk_path else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _fresh(self, created: float) -> bool:
+        return self.ttl <= 0 or time.time() - created < self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._fresh(entry[0]):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+        if self._disk is not None:
+            stored = self._disk.get(key)
+            if stored is not None and self._fresh(stored["created"]):
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, stored["created"], stored["comment"])
+                return stored["comment"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, comment: str) -> None:
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, comment)
+        if self._disk is not None:
+            self._disk.put(key, {"created": created, "comment": comment})
+
+    def _remember(self, key: str, created: float, comment: str) -> None:
+        self._memory[key] = (created, comment)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_tier": self._disk is not None,
+            }
+
+
+_CACHE: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _CACHE
+    if _CACHE is None:
+        disk_path = os.getenv("PULL_PAL_CACHE_PATH")
+        _CACHE = ResponseCache(
+            max_entries=int(os.getenv("PULL_PAL_CACHE_SIZE", "4096")),
+            ttl_seconds=float(os.getenv("PULL_PAL_CACHE_TTL", "86400")),
+            disk_path=Path(disk_path) if disk_path else None,
+        )
+    return _CACHE
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass(frozen=True)
+class DecodingProfile:
+    name: str
+    num_beams: int
+    max_length: int = 128
+    early_stopping: bool = True
+
+    def generation_params(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"max_length": self.max_length, "num_beams": self.num_beams}
+        if self.num_beams > 1:
+            params["early_stopping"] = self.early_stopping
+        return params
+
+
+PROFILES: Dict[str, DecodingProfile] = {
+    "greedy": DecodingProfile("greedy", num_beams=1),
+    "small_beam": DecodingProfile("small_beam", num_beams=2),
+    "full_beam": DecodingProfile("full_beam", num_beams=4),
+}
+# Strongest first; the budget chooser walks this list and takes the first that fits.
+PROFILE_ORDER = ("full_beam", "small_beam", "greedy")
+DEFAULT_PROFILE = "full_beam"
+
+
+class CostModel:
+    """Running estimate of seconds per decoding step for each profile.
+
+    Seeded with rough CPU priors and updated with an exponential moving average
+    from every batch the server actually decodes.
+    """
+
+    PRIORS = {"greedy": 0.01, "small_beam": 0.02, "full_beam": 0.04}
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._per_step: Dict[str, float] = dict(self.PRIORS)
+        self._lock = threading.Lock()
+
+    def observe(self, profile: str, seconds: float, steps: int) -> None:
+        if steps <= 0:
+            return
+        sample = seconds / steps
+        with self._lock:
+            previous = self._per_step.get(profile, sample)
+            self._per_step[profile] = (1 - self.alpha) * previous + self.alpha * sample
+
+    def estimate(self, profile: DecodingProfile) -> float:
+        with self._lock:
+            return self._per_step.get(profile.name, self.PRIORS["full_beam"]) * profile.max_length
+
+    def choose(self, budget_seconds: float) -> DecodingProfile:
+        for name in PROFILE_ORDER:
+            if self.estimate(PROFILES[name]) <= budget_seconds:
+                return PROFILES[name]
+        return PROFILES[PROFILE_ORDER[-1]]
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._per_step)
+
+
+def resolve_profile(
+    costs: CostModel, profile: Optional[str] = None, budget_seconds: Optional[float] = None
+) -> DecodingProfile:
+    """Pick an explicit profile, else the strongest one that fits the budget, else the default."""
+    if profile is not None:
+        return PROFILES[profile]
+    if budget_seconds is not None:
+        return costs.choose(budget_seconds)
+    return PROFILES[DEFAULT_PROFILE]
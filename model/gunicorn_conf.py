@@ -0,0 +1,70 @@
+"""Gunicorn settings for multi-worker CPU serving.
+
+    gunicorn -c model/gunicorn_conf.py model.api:app
+
+The master loads the model once before forking, so workers share the weight
+pages copy-on-write instead of each holding a copy. Each worker then gets an
+equal slice of the usable cores as its torch intra-op thread pool.
+"""
+from __future__ import annotations
+
+import gc
+import os
+
+
+bind = os.getenv("PULL_PAL_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("PULL_PAL_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("PULL_PAL_WORKER_TIMEOUT", "120"))
+
+# The tokenizer is created in the master; its Rust thread pool must not be used across fork.
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def usable_cores() -> int:
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def worker_threads(worker_count: int) -> int:
+    override = os.getenv("PULL_PAL_THREADS_PER_WORKER")
+    return int(override) if override else max(1, usable_cores() // max(1, worker_count))
+
+
+def when_ready(server) -> None:
+    """Runs in the master after the app is imported and before any worker is forked."""
+    import torch
+
+    from model.inference import get_model
+
+    if os.getenv("PULL_PAL_BACKEND", "fp32") == "onnx":
+        # ONNX Runtime sessions own thread pools that do not survive fork; workers load their own.
+        server.log.info("onnx backend: skipping preload, each worker loads the model")
+        return
+    # Keep the master out of OpenMP parallel regions so forked workers start with a clean pool.
+    torch.set_num_threads(1)
+    torch.set_grad_enabled(False)
+    get_model()
+    # Move everything allocated so far out of the collector's view, so GC passes in the
+    # workers do not touch (and copy) the shared pages.
+    gc.freeze()
+    server.log.info("Preloaded model for %d workers (%d intra-op threads each)", workers, worker_threads(workers))
+
+
+def pre_fork(server, worker) -> None:
+    """Runs in the master: give the new worker the first core slice no live worker holds."""
+    taken = {getattr(live, "pin_slot", None) for live in server.WORKERS.values()}
+    worker.pin_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker) -> None:
+    import torch
+
+    threads = worker_threads(server.cfg.workers)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    torch.set_num_threads(threads)
+    if os.getenv("PULL_PAL_PIN_WORKERS") == "1" and hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        slot = worker.pin_slot % server.cfg.workers
+        os.sched_setaffinity(0, cores[slot * threads : (slot + 1) * threads] or cores)
+    worker.log.info("Worker %s using %d intra-op threads", worker.pid, threads)
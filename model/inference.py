@@ -1,56 +1,118 @@
 from __future__ import annotations
 
+import os
+import time
+from dataclasses import replace
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Sequence
 
+import torch
 from transformers import AutoTokenizer, EncoderDecoderModel
 
+from core.prompt import MAX_SOURCE_LENGTH, PromptBuilder
+from core.utils import PullPalError
+
+from .backends import load_backend
+from .cache import response_key
+from .decoding import DEFAULT_PROFILE, PROFILES, CostModel, DecodingProfile
+from .metrics import BATCH_SIZE, INPUT_TOKENS, MODEL_LOAD_SECONDS, OUTPUT_TOKENS, STAGE_SECONDS
+
 
 class ReviewModel:
     """Thin wrapper around the fine-tuned encoder-decoder model."""
 
-    def __init__(self, model_dir: Path | str = Path("model/checkpoints/final"), base_model: str = "microsoft/codebert-base"):
+    def __init__(
+        self,
+        model_dir: Path | str = Path("model/checkpoints/final"),
+        base_model: str = "microsoft/codebert-base",
+        backend: str = "fp32",
+    ):
         model_path = Path(model_dir)
+        self.backend = backend
+        self.costs = CostModel()
         if model_path.exists():
             self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-            self.model = EncoderDecoderModel.from_pretrained(model_path)
+            self.model = load_backend(model_path, backend)
+            config_path = model_path / "config.json"
+            stamp = config_path.stat().st_mtime_ns if config_path.exists() else 0
+            self.model_id = f"{model_path.resolve()}@{stamp}:{backend}"
         else:
+            if backend != "fp32":
+                raise PullPalError(f"Backend {backend} needs an exported checkpoint at {model_path}")
             self.tokenizer = AutoTokenizer.from_pretrained(base_model)
             self.model = EncoderDecoderModel.from_encoder_decoder_pretrained(base_model, base_model)
-        self.model.eval()
-
-    def _format_input(self, payload: Dict) -> str:
-        ctx = payload.get("context") or {}
-        lint = payload.get("lint") or []
-        lint_str = " | ".join(f"{item['code']}:{item['message']}" for item in lint) or "none"
-        ctx_bits = [ctx.get("symbol_type"), ctx.get("symbol"), ctx.get("signature")]
-        ctx_str = " | ".join([bit for bit in ctx_bits if bit]) or "N/A"
-        return (
-            f"File: {payload.get('path')}\n"
-            f"Line: {payload.get('line')}\n"
-            f"Diff:\n{payload.get('diff_hunk')}\n"
-            f"Context: {ctx_str}\n"
-            f"Lint: {lint_str}\n"
-            "Provide a concise, constructive code review comment."
-        )
+            self.model.eval()
+            self.model_id = f"{base_model}@untrained"
+        # Same builder as make_hf_dataset, so serving inputs match training inputs token for token.
+        self.prompts = PromptBuilder(self.tokenizer, min(MAX_SOURCE_LENGTH, self.tokenizer.model_max_length))
+
+    def encode(self, payload: Dict) -> List[int]:
+        return self.prompts.build(payload)
+
+    def cache_key(self, input_ids: Sequence[int], profile: Optional[DecodingProfile] = None) -> str:
+        profile = profile or PROFILES[DEFAULT_PROFILE]
+        return response_key(input_ids, profile.generation_params(), self.model_id)
 
     def generate_comment(self, payload: Dict, *, max_length: int = 128) -> str:
-        prompt = self._format_input(payload)
-        encoded = self.tokenizer(prompt, return_tensors="pt", truncation=True)
-        output_ids = self.model.generate(
-            **encoded,
-            max_length=max_length,
-            num_beams=4,
-            early_stopping=True,
-        )
-        return self.tokenizer.decode(output_ids[0], skip_special_tokens=True).strip()
+        return self.generate_comments([payload], max_length=max_length)[0]
+
+    def generate_comments(
+        self,
+        payloads: List[Dict],
+        *,
+        input_ids: Optional[List[List[int]]] = None,
+        encode_seconds: float = 0.0,
+        max_length: int = 128,
+        profile: Optional[DecodingProfile] = None,
+        max_time: Optional[float] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> List[str]:
+        """Generate comments for a padded batch.
+
+        ``max_time`` (seconds) stops decoding once the deadline passes and returns
+        whatever has been produced so far. Per-stage durations are recorded in the
+        metrics registry and, when given, copied into ``timings``. Callers that already
+        ran ``encode`` pass the prompts as ``input_ids`` and the time it took as
+        ``encode_seconds``, which is counted in the tokenize stage.
+        """
+        profile = profile or replace(PROFILES[DEFAULT_PROFILE], max_length=max_length)
+        marks = [time.perf_counter()]
+        if input_ids is None:
+            input_ids = self.prompts.build_batch(payloads)
+        encoded = self.tokenizer.pad({"input_ids": input_ids}, return_tensors="pt")
+        marks.append(time.perf_counter())
+        params = profile.generation_params()
+        if max_time is not None:
+            params["max_time"] = max(max_time, 1e-3)
+        with torch.inference_mode():
+            output_ids = self.model.generate(**encoded, **params)
+        marks.append(time.perf_counter())
+        comments = [text.strip() for text in self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)]
+        marks.append(time.perf_counter())
+
+        stages = dict(zip(("tokenize", "generate", "decode"), (b - a for a, b in zip(marks, marks[1:]))))
+        stages["tokenize"] += encode_seconds
+        for stage, seconds in stages.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        BATCH_SIZE.observe(len(payloads))
+        INPUT_TOKENS.inc(int(encoded["attention_mask"].sum()))
+        OUTPUT_TOKENS.inc(int((output_ids != self.tokenizer.pad_token_id).sum()))
+        self.costs.observe(profile.name, stages["generate"], output_ids.shape[-1])
+        if timings is not None:
+            timings.update(stages)
+        return comments
 
 
 _MODEL: Optional[ReviewModel] = None
 
 
-def get_model(model_dir: Path | str | None = None) -> ReviewModel:
+def get_model(model_dir: Path | str | None = None, backend: Optional[str] = None) -> ReviewModel:
     global _MODEL
     if _MODEL is None:
-        _MODEL = ReviewModel(model_dir=model_dir or Path("model/checkpoints/final"))
+        started = time.perf_counter()
+        _MODEL = ReviewModel(
+            model_dir=model_dir or Path("model/checkpoints/final"),
+            backend=backend or os.getenv("PULL_PAL_BACKEND", "fp32"),
+        )
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - started)
     return _MODEL
@@ -2,12 +2,14 @@ from __future__ import annotations
 
 import argparse
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Set
 
 from git import Repo
 
-from core import utils
+from core import instrument, utils
 from core.ast_context import ContextExtractor
+from core.cache import DEFAULT_CACHE_PATH, BlobCache
+from core.git_store import MIRROR_ROOT, TreeSource, WorkTreeSource, tree_for_metadata
 
 
 def ensure_repo(metadata: Dict, repo_dir: Path) -> Path:
@@ -23,33 +25,88 @@ def ensure_repo(metadata: Dict, repo_dir: Path) -> Path:
     return repo_dir
 
 
+def add_context(
+    summary_path: Path,
+    metadata_path: Path,
+    *,
+    repo_dir: Optional[Path] = None,
+    out_path: Optional[Path] = None,
+    cache_path: Optional[Path] = DEFAULT_CACHE_PATH,
+    mirror_root: Path = MIRROR_ROOT,
+    changed: Optional[Set[str]] = None,
+) -> Dict[str, int]:
+    """Write diff_with_ctx for one PR and return the AST cache counters.
+
+    Sources are read from the PR head in the shared bare mirror unless an explicit
+    ``repo_dir`` clone is given. With ``changed``, contexts of other files are taken
+    from the existing output when their added lines are unchanged.
+    """
+    summary = utils.load_files(summary_path)
+    out_path = out_path or utils.artifact_path(summary_path.parent, "diff_with_ctx")
+    previous = utils.previous_files(out_path, changed)
+    reused = {
+        entry["path"]: previous[entry["path"]]
+        for entry in summary["files"]
+        if entry["path"] in previous and previous[entry["path"]]["added_lines"] == entry["added_lines"]
+    }
+    metadata = utils.load_json(metadata_path)
+    mirror = None
+    if repo_dir:
+        source: TreeSource = WorkTreeSource(ensure_repo(metadata, repo_dir))
+    else:
+        mirror, source = tree_for_metadata(metadata, mirror_root)
+    cache = BlobCache(cache_path, namespace="ast_spans:v1") if cache_path else None
+    extractor = ContextExtractor(source, cache=cache)
+
+    requests = {
+        file_entry["path"]: sorted(set(file_entry["added_lines"]))
+        for file_entry in summary["files"]
+        if file_entry["path"].endswith(".py") and file_entry.get("added_lines") and file_entry["path"] not in reused
+    }
+    try:
+        contexts = extractor.get_contexts(requests)
+    finally:
+        if mirror is not None:
+            mirror.close()
+    enriched_files: List[Dict] = [
+        reused.get(file_entry["path"])
+        or {**file_entry, "contexts": [ctx.__dict__ for ctx in contexts.get(file_entry["path"], [])]}
+        for file_entry in summary["files"]
+    ]
+
+    utils.dump_files({"files": enriched_files}, out_path)
+    if cache is None:
+        return {}
+    cache.close()
+    return cache.stats()
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Enrich diff summary with AST context.")
-    parser.add_argument("--summary", type=Path, required=True, help="Path to diff_summary.json")
+    parser.add_argument("--summary", type=Path, required=True, help="Path to diff_summary (.arrow, .json or .jsonl)")
     parser.add_argument("--metadata", type=Path, required=True, help="Path to metadata.json from fetch_pr")
-    parser.add_argument("--repo-dir", type=Path, default=None, help="Existing clone to reuse.")
-    parser.add_argument("--out", type=Path, default=None, help="Output file (defaults to diff_with_ctx.json next to summary).")
+    parser.add_argument("--repo-dir", type=Path, default=None, help="Existing clone to use instead of the shared mirror.")
+    parser.add_argument("--mirror-root", type=Path, default=MIRROR_ROOT, help="Directory holding shared bare mirrors.")
+    parser.add_argument("--out", type=Path, default=None, help="Output file (defaults to diff_with_ctx next to summary).")
+    parser.add_argument("--format", choices=sorted(utils.ARTIFACT_FORMATS), default=None, help="Format of the default output.")
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH, help="SQLite cache of symbol spans keyed by blob SHA.")
+    parser.add_argument("--no-cache", action="store_true", help="Parse every file even if it was seen before.")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
-    summary = utils.load_json(args.summary)
-    metadata = utils.load_json(args.metadata)
-    repo_dir = args.repo_dir or (args.summary.parent / "repo")
-    repo_root = ensure_repo(metadata, repo_dir)
-    extractor = ContextExtractor(repo_root)
-
-    enriched_files: List[Dict] = []
-    for file_entry in summary["files"]:
-        path = file_entry["path"]
-        added_lines = file_entry.get("added_lines", [])
-        if not path.endswith(".py") or not added_lines:
-            enriched_files.append({**file_entry, "contexts": []})
-            continue
-        contexts = extractor.get_context(path, sorted(set(added_lines)))
-        enriched_files.append({**file_entry, "contexts": [ctx.__dict__ for ctx in contexts]})
-
-    out_path = args.out or (args.summary.parent / "diff_with_ctx.json")
-    utils.dump_json({"files": enriched_files}, out_path)
+    out_path = args.out or utils.artifact_path(args.summary.parent, "diff_with_ctx", args.format)
+    with instrument.session(args, "add_context", pr=utils.pr_label(utils.load_json(args.metadata))):
+        stats = add_context(
+            args.summary,
+            args.metadata,
+            repo_dir=args.repo_dir,
+            out_path=out_path,
+            cache_path=None if args.no_cache else args.cache,
+            mirror_root=args.mirror_root,
+        )
     print(f"Wrote context-enriched diff to {out_path}")
+    if stats:
+        print(f"AST cache: {stats['hits']} hits, {stats['misses']} misses")
 
 
 if __name__ == "__main__":
@@ -2,13 +2,13 @@ from __future__ import annotations
 
 import argparse
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from core import utils
+from core import instrument, utils
 
 
-def load_contexts(ctx_path: Path) -> Dict[Tuple[str, int], Dict]:
-    ctx_json = utils.load_json(ctx_path)
+def load_contexts(ctx_path: Path, paths: Optional[Set[str]] = None) -> Dict[Tuple[str, int], Dict]:
+    ctx_json = utils.load_files(ctx_path, paths)
     mapping: Dict[Tuple[str, int], Dict] = {}
     for file_entry in ctx_json["files"]:
         for ctx in file_entry.get("contexts", []):
@@ -24,56 +24,130 @@ def hunk_string(lines: Iterable[Dict]) -> str:
     return "\n".join(rows)
 
 
-def build_examples(diff_path: Path, ctx_path: Path, comments_path: Path) -> List[Dict]:
-    diff = utils.load_json(diff_path)
-    ctx_lookup = load_contexts(ctx_path)
+def index_hunks(hunks: List[Dict]) -> Dict[int, Tuple[int, int]]:
+    """Map each target line to the first hunk that contains it and its row within that hunk."""
+    index: Dict[int, Tuple[int, int]] = {}
+    for pos, hunk in enumerate(hunks):
+        for row, entry in enumerate(hunk["lines"]):
+            if entry["target"] is not None:
+                index.setdefault(entry["target"], (pos, row))
+    return index
+
+
+def index_lints(lints: List[Dict]) -> Dict[int, List[Dict]]:
+    index: Dict[int, List[Dict]] = {}
+    for warn in lints:
+        index.setdefault(warn["line"], []).append(warn)
+    return index
+
+
+class _FileIndex:
+    def __init__(self, file_entry: Dict):
+        self.hunks = file_entry["hunks"]
+        self.hunk_by_line = index_hunks(self.hunks)
+        self.lint_by_line = index_lints(file_entry.get("lint", []))
+        self._rendered: Dict[int, str] = {}
+
+    def hunk_text(self, line: int) -> Optional[str]:
+        if line not in self.hunk_by_line:
+            return None
+        pos = self.hunk_by_line[line][0]
+        if pos not in self._rendered:
+            self._rendered[pos] = hunk_string(self.hunks[pos]["lines"])
+        return self._rendered[pos]
+
+
+def iter_examples(diff_path: Path, ctx_path: Path, comments_path: Path) -> Iterator[Dict]:
     comments = utils.load_json(comments_path)
+    # Only files that received comments can yield examples; columnar artifacts skip the rest.
+    commented = {comment["path"] for comment in comments if comment.get("path")}
+    diff = utils.load_files(diff_path, commented)
+    ctx_lookup = load_contexts(ctx_path, commented)
 
-    file_map = {file_entry["path"]: file_entry for file_entry in diff["files"]}
-    examples: List[Dict] = []
+    file_entries = {file_entry["path"]: file_entry for file_entry in diff["files"]}
+    indexes: Dict[str, _FileIndex] = {}
     for comment in comments:
         path = comment.get("path")
         line = comment.get("line")
-        if path not in file_map or line is None:
+        if path not in file_entries or line is None:
             continue
-        file_entry = file_map[path]
-        hunk = _find_hunk(file_entry["hunks"], line)
-        if not hunk:
+        if path not in indexes:
+            indexes[path] = _FileIndex(file_entries[path])
+        file_index = indexes[path]
+        diff_hunk = file_index.hunk_text(line)
+        if diff_hunk is None:
             continue
-        lint_hits = [warn for warn in file_entry.get("lint", []) if warn["line"] == line]
-        context = ctx_lookup.get((path, line))
-        examples.append(
-            {
-                "path": path,
-                "line": line,
-                "comment": comment.get("body", ""),
-                "diff_hunk": hunk_string(hunk["lines"]),
-                "context": context,
-                "lint": lint_hits,
-            }
-        )
-    return examples
-
-
-def _find_hunk(hunks: List[Dict], line: int) -> Optional[Dict]:
-    for hunk in hunks:
-        for entry in hunk["lines"]:
-            if entry["target"] == line:
-                return hunk
-    return None
+        yield {
+            "path": path,
+            "line": line,
+            "comment": comment.get("body", ""),
+            "diff_hunk": diff_hunk,
+            "target_index": file_index.hunk_by_line[line][1],
+            "context": ctx_lookup.get((path, line)),
+            "lint": list(file_index.lint_by_line.get(line, [])),
+        }
+
+
+def build_examples(diff_path: Path, ctx_path: Path, comments_path: Path) -> List[Dict]:
+    with instrument.stage("build_examples") as record:
+        examples = list(iter_examples(diff_path, ctx_path, comments_path))
+        record["examples"] = len(examples)
+        return examples
+
+
+def iter_pr_dirs_examples(pr_dirs: Iterable[Path], skipped: Optional[List[Path]] = None) -> Iterator[Dict]:
+    """Stream examples for many PR directories; ones with missing inputs are appended to ``skipped``."""
+    for pr_dir in pr_dirs:
+        inputs = [
+            utils.find_artifact(pr_dir, "diff_with_lint"),
+            utils.find_artifact(pr_dir, "diff_with_ctx"),
+            pr_dir / "pull_comments.json",
+        ]
+        if not all(path.exists() for path in inputs):
+            if skipped is not None:
+                skipped.append(pr_dir)
+            continue
+        yield from iter_examples(*inputs)
+
+
+class _Counter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def wrap(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+        for row in rows:
+            self.count += 1
+            yield row
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Match enriched diffs to review comments for training examples.")
-    parser.add_argument("--diff", type=Path, required=True, help="Path to diff_with_lint.json")
-    parser.add_argument("--ctx", type=Path, required=True, help="Path to diff_with_ctx.json")
-    parser.add_argument("--comments", type=Path, required=True, help="Path to pull_comments.json")
+    parser.add_argument("--diff", type=Path, default=None, help="Path to diff_with_lint (.arrow, .json or .jsonl)")
+    parser.add_argument("--ctx", type=Path, default=None, help="Path to diff_with_ctx (.arrow, .json or .jsonl)")
+    parser.add_argument("--comments", type=Path, default=None, help="Path to pull_comments.json")
+    parser.add_argument("--pr-dirs", type=Path, nargs="+", default=None, help="Build examples for many PR directories in one run.")
     parser.add_argument("--out", type=Path, default=None, help="Output JSONL file path.")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
-    examples = build_examples(args.diff, args.ctx, args.comments)
+    if args.pr_dirs:
+        if args.out is None:
+            parser.error("--out is required with --pr-dirs")
+        counter = _Counter()
+        skipped: List[Path] = []
+        with instrument.session(args, "build_examples", prs=len(args.pr_dirs)):
+            utils.dump_jsonl(counter.wrap(iter_pr_dirs_examples(args.pr_dirs, skipped)), args.out)
+        for pr_dir in skipped:
+            print(f"Skipping {pr_dir}: missing inputs")
+        print(f"Wrote {counter.count} examples from {len(args.pr_dirs)} PRs to {args.out}")
+        return
+
+    if not (args.diff and args.ctx and args.comments):
+        parser.error("--diff, --ctx and --comments are required unless --pr-dirs is given")
     out_path = args.out or (args.comments.parent / "examples.jsonl")
-    utils.dump_jsonl(examples, out_path)
+    with instrument.session(args, "build_examples"):
+        examples = build_examples(args.diff, args.ctx, args.comments)
+        utils.dump_jsonl(examples, out_path)
     print(f"Wrote {len(examples)} examples to {out_path}")
 
 
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from core import instrument, utils
+from core.dedup import DEFAULT_INDEX_PATH, DedupIndex
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Drop near-duplicate hunk/comment pairs from examples JSONL before make_hf_dataset."
+    )
+    parser.add_argument("examples", type=Path, nargs="+", help="Examples JSONL files; earlier files win ties.")
+    parser.add_argument("--out-dir", type=Path, required=True, help="Deduplicated files are written here under the same names.")
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=DEFAULT_INDEX_PATH,
+        help="Persistent MinHash LSH index; reuse it so new shards are checked against everything kept before.",
+    )
+    parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity counted as duplicate.")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash permutations (fixed once the index exists).")
+    parser.add_argument("--bands", type=int, default=16, help="LSH bands; more bands find less similar candidates.")
+    parser.add_argument("--shingle", type=int, default=3, help="Words per shingle.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    index = DedupIndex(args.index, threshold=args.threshold, num_perm=args.num_perm, bands=args.bands, shingle=args.shingle)
+    with instrument.session(args, "dedup_examples", shards=len(args.examples)):
+        try:
+            for examples_path in args.examples:
+                before = index.stats()
+                out_path = args.out_dir / examples_path.name
+                utils.dump_jsonl(index.filter(utils.iter_jsonl(examples_path)), out_path)
+                kept = index.kept - before["kept"]
+                dropped = index.dropped - before["dropped"]
+                print(f"{examples_path}: kept {kept}, dropped {dropped} near-duplicates -> {out_path}")
+        finally:
+            index.close()
+    print(f"Kept {index.kept} examples, dropped {index.dropped}")
+
+
+if __name__ == "__main__":
+    main()
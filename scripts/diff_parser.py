@@ -1,78 +1,202 @@
 from __future__ import annotations
 
 import argparse
+import json
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from unidiff import PatchSet
+from unidiff.patch import PatchedFile
 
-from core import utils
+from core import instrument, utils
 
 
-def summarize_diff(patch_text: str) -> Dict[str, List[Dict[str, List[int]]]]:
-    patch = PatchSet(patch_text)
-    files_summary = []
-    files_full = []
-
-    for patched_file in patch:
-        added_lines = [
-            line.target_line_no
-            for hunk in patched_file
-            for line in hunk
-            if line.is_added and line.target_line_no is not None
-        ]
-        removed_lines = [
-            line.source_line_no
-            for hunk in patched_file
-            for line in hunk
-            if line.is_removed and line.source_line_no is not None
-        ]
-        files_summary.append(
-            {
-                "path": patched_file.path,
-                "added_lines": added_lines,
-                "removed_lines": removed_lines,
-            }
-        )
-        files_full.append(
+def _file_records(patched_file: PatchedFile) -> Tuple[Dict, Dict]:
+    added_lines = [
+        line.target_line_no
+        for hunk in patched_file
+        for line in hunk
+        if line.is_added and line.target_line_no is not None
+    ]
+    removed_lines = [
+        line.source_line_no
+        for hunk in patched_file
+        for line in hunk
+        if line.is_removed and line.source_line_no is not None
+    ]
+    summary = {
+        "path": patched_file.path,
+        "added_lines": added_lines,
+        "removed_lines": removed_lines,
+    }
+    full = {
+        "path": patched_file.path,
+        "hunks": [
             {
-                "path": patched_file.path,
-                "hunks": [
+                "target_start": hunk.target_start,
+                "target_length": hunk.target_length,
+                "source_start": hunk.source_start,
+                "source_length": hunk.source_length,
+                "lines": [
                     {
-                        "target_start": hunk.target_start,
-                        "target_length": hunk.target_length,
-                        "source_start": hunk.source_start,
-                        "source_length": hunk.source_length,
-                        "lines": [
-                            {
-                                "type": "add" if line.is_added else "del" if line.is_removed else "ctx",
-                                "source": line.source_line_no,
-                                "target": line.target_line_no,
-                                "text": line.value.rstrip("\n"),
-                            }
-                            for line in hunk
-                        ],
+                        "type": "add" if line.is_added else "del" if line.is_removed else "ctx",
+                        "source": line.source_line_no,
+                        "target": line.target_line_no,
+                        "text": line.value.rstrip("\n"),
                     }
-                    for hunk in patched_file
+                    for line in hunk
                 ],
             }
-        )
+            for hunk in patched_file
+        ],
+    }
+    return summary, full
+
+
+def summarize_diff(patch_text: str) -> Dict[str, List[Dict[str, List[int]]]]:
+    files_summary = []
+    files_full = []
+    for patched_file in PatchSet(patch_text):
+        summary, full = _file_records(patched_file)
+        files_summary.append(summary)
+        files_full.append(full)
     return {"files": files_summary}, {"files": files_full}
 
 
+def split_file_diffs(lines: Iterable[str]) -> Iterator[str]:
+    """Split a patch into per-file chunks at ``diff --git`` headers.
+
+    Patches without git headers come back as a single chunk.
+    """
+    chunk: List[str] = []
+    for line in lines:
+        if line.startswith("diff --git ") and chunk:
+            yield "".join(chunk)
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield "".join(chunk)
+
+
+def stream_diff(lines: Iterable[str]) -> Iterator[Tuple[Dict, Dict]]:
+    """Yield ``(summary, full)`` records file by file, holding one file diff at a time."""
+    for chunk in split_file_diffs(lines):
+        for patched_file in PatchSet(chunk):
+            yield _file_records(patched_file)
+
+
+def _chunk_path(chunk: str) -> Optional[str]:
+    """Path of a per-file chunk as unidiff reports it: the target, or the source for deletions."""
+    source = None
+    for line in chunk.splitlines():
+        if line.startswith("--- a/"):
+            source = line[6:]
+        elif line.startswith("+++ "):
+            return line[6:] if line.startswith("+++ b/") else source
+        elif line.startswith("@@"):
+            break
+    return None
+
+
+def update_patch_file(patch_path: Path, out_dir: Path, changed: Set[str], fmt: Optional[str] = None) -> int:
+    """Re-parse only the files in ``changed``, reusing the previous records for the rest.
+
+    Returns the number of files parsed. Files that left the diff are dropped.
+    """
+    summary_path = utils.artifact_path(out_dir, "diff_summary", fmt)
+    full_path = utils.artifact_path(out_dir, "diff_full", fmt)
+    old_summary = {entry["path"]: entry for entry in utils.load_files(summary_path)["files"]}
+    old_full = {entry["path"]: entry for entry in utils.load_files(full_path)["files"]}
+    files_summary: List[Dict] = []
+    files_full: List[Dict] = []
+    parsed = 0
+    with patch_path.open("r", encoding="utf-8") as patch_fh:
+        for chunk in split_file_diffs(patch_fh):
+            path = _chunk_path(chunk)
+            if path is not None and path not in changed and path in old_summary and path in old_full:
+                files_summary.append(old_summary[path])
+                files_full.append(old_full[path])
+                continue
+            parsed += 1
+            for patched_file in PatchSet(chunk):
+                summary, full = _file_records(patched_file)
+                files_summary.append(summary)
+                files_full.append(full)
+    utils.dump_files({"files": files_summary}, summary_path)
+    utils.dump_files({"files": files_full}, full_path)
+    return parsed
+
+
+def parse_patch_file(
+    patch_path: Path,
+    out_dir: Optional[Path] = None,
+    *,
+    stream: bool = False,
+    fmt: Optional[str] = None,
+    changed: Optional[Set[str]] = None,
+) -> Path:
+    """Write diff_summary/diff_full for ``patch_path``.
+
+    With ``changed``, previous artifacts in ``out_dir`` are updated in place and only
+    those files are parsed again.
+    """
+    out_dir = Path(out_dir or patch_path.parent)
+    with instrument.stage("parse_diff", bytes=patch_path.stat().st_size, stream=stream) as record:
+        if stream:
+            record["files"] = _write_streaming(patch_path, out_dir)
+            return out_dir
+        previous = [utils.artifact_path(out_dir, stem, fmt) for stem in ("diff_summary", "diff_full")]
+        if changed is not None and all(path.exists() for path in previous):
+            record["files"] = update_patch_file(patch_path, out_dir, changed, fmt)
+            record["incremental"] = True
+            return out_dir
+        patch_text = utils.read_patch(patch_path)
+        summary, full = summarize_diff(patch_text)
+        record["files"] = len(summary["files"])
+        utils.dump_files(summary, utils.artifact_path(out_dir, "diff_summary", fmt))
+        utils.dump_files(full, utils.artifact_path(out_dir, "diff_full", fmt))
+        return out_dir
+
+
+def _write_streaming(patch_path: Path, out_dir: Path) -> int:
+    utils.ensure_dir(out_dir)
+    summary_path = out_dir / "diff_summary.jsonl"
+    full_path = out_dir / "diff_full.jsonl"
+    summary_tmp = summary_path.with_name(f".{summary_path.name}.tmp")
+    full_tmp = full_path.with_name(f".{full_path.name}.tmp")
+    with patch_path.open("r", encoding="utf-8") as patch_fh, summary_tmp.open(
+        "w", encoding="utf-8"
+    ) as summary_fh, full_tmp.open("w", encoding="utf-8") as full_fh:
+        files = 0
+        for summary, full in stream_diff(patch_fh):
+            files += 1
+            summary_fh.write(json.dumps(summary, separators=(",", ":")) + "\n")
+            full_fh.write(json.dumps(full, separators=(",", ":")) + "\n")
+    summary_tmp.replace(summary_path)
+    full_tmp.replace(full_path)
+    return files
+
+
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Parse a PR diff patch into JSON summaries.")
+    parser = argparse.ArgumentParser(description="Parse a PR diff patch into per-file summaries.")
     parser.add_argument("patch", type=Path, help="Path to diff.patch file.")
     parser.add_argument("--out-dir", type=Path, default=None, help="Directory for parsed artifacts.")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse file by file and write diff_summary.jsonl/diff_full.jsonl with one record per file.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(utils.ARTIFACT_FORMATS),
+        default=None,
+        help="Artifact format (defaults to $PULL_PAL_ARTIFACT_FORMAT or arrow); ignored with --stream.",
+    )
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
-    patch_path = args.patch
-    out_dir = args.out_dir or patch_path.parent
-    patch_text = utils.read_patch(patch_path)
-
-    summary, full = summarize_diff(patch_text)
-    utils.dump_json(summary, Path(out_dir) / "diff_summary.json")
-    utils.dump_json(full, Path(out_dir) / "diff_full.json")
+    with instrument.session(args, "diff_parser"):
+        out_dir = parse_patch_file(args.patch, args.out_dir, stream=args.stream, fmt=args.format)
     print(f"Wrote summaries to {out_dir}")
 
 
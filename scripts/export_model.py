@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from core import instrument, utils
+from model.backends import EXPORTERS, parity_report
+from model.inference import ReviewModel
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert a checkpoint for a faster CPU inference backend.")
+    parser.add_argument("--model-dir", type=Path, default=Path("model/checkpoints/final"))
+    parser.add_argument("--backend", choices=sorted(EXPORTERS), required=True)
+    parser.add_argument("--check", type=Path, default=None, help="examples.jsonl used for an fp32 parity check.")
+    parser.add_argument("--check-limit", type=int, default=32)
+    parser.add_argument("--min-similarity", type=float, default=0.8, help="Fail if mean token similarity drops below this.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.session(args, "export_model"):
+        with instrument.stage("export", backend=args.backend):
+            out_dir = EXPORTERS[args.backend](args.model_dir)
+        print(f"Exported {args.backend} backend to {out_dir}")
+        if args.check is None:
+            return
+
+        payloads = []
+        with args.check.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    payloads.append(json.loads(line))
+                if len(payloads) >= args.check_limit:
+                    break
+        reference = ReviewModel(args.model_dir, backend="fp32")
+        candidate = ReviewModel(args.model_dir, backend=args.backend)
+        with instrument.stage("parity_check", examples=len(payloads)):
+            report = parity_report(reference.generate_comments(payloads), candidate.generate_comments(payloads))
+        report["backend"] = args.backend
+        utils.dump_json(report, out_dir / "parity.json")
+        print(json.dumps(report, indent=2))
+        if report["token_similarity"] < args.min_similarity:
+            sys.exit(f"{args.backend} parity below {args.min_similarity}: {report['token_similarity']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
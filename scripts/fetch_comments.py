@@ -1,36 +1,97 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
 
-import requests
+from core import instrument, utils
+from core.github import AsyncGitHubClient, get_client
 
-from core import utils
 
+PER_PAGE = 100
+PAGE_WORKERS = 8
+GRAPHQL_BATCH = 10
+THREADS_PAGE = 50
+THREAD_COMMENTS = 100
 
-API_ROOT = "https://api.github.com"
+COMMENTS_PAGE = """
+pageInfo { hasNextPage endCursor }
+nodes {
+  databaseId body path line originalLine diffHunk createdAt
+  author { login }
+  commit { oid }
+  replyTo { databaseId }
+}
+"""
+THREAD_FIELDS = f"""
+pageInfo {{ hasNextPage endCursor }}
+nodes {{
+  id
+  comments(first: {THREAD_COMMENTS}) {{ {COMMENTS_PAGE} }}
+}}
+"""
+
+
+def _comments_path(owner: str, repo: str, pr_number: int) -> str:
+    return f"/repos/{owner}/{repo}/pulls/{pr_number}/comments"
+
+
+def _page_params(page: int) -> Dict[str, int]:
+    return {"per_page": PER_PAGE, "page": page}
+
+
+def _last_page(link_header: Optional[str]) -> Optional[int]:
+    """Page number of the ``last`` link, or None when the header does not give one."""
+    last = _parse_link_header(link_header).get("last")
+    if last is None:
+        return None
+    pages = parse_qs(urlsplit(last).query).get("page")
+    return int(pages[0]) if pages else None
+
+
+def _valid(batches: Sequence[List[Dict]]) -> List[Dict]:
+    return [c for batch in batches for c in batch if c.get("path") and c.get("line")]
 
 
 def fetch_comments(owner: str, repo: str, pr_number: int) -> List[Dict]:
+    """Review comments of one PR; once the first page reveals the last one, the rest are fetched in parallel."""
+    client = get_client()
+    path = _comments_path(owner, repo, pr_number)
+    resp = client.request("GET", path, params=_page_params(1))
+    batches = [resp.json()]
+    last = _last_page(resp.headers.get("Link"))
+    if last is not None and last > 1:
+        with ThreadPoolExecutor(max_workers=min(PAGE_WORKERS, last - 1)) as pool:
+            pages = range(2, last + 1)
+            batches.extend(pool.map(instrument.bind(lambda page: client.get_json(path, params=_page_params(page))), pages))
+        return _valid(batches)
     page = 1
-    comments: List[Dict] = []
-    headers = utils.github_headers()
-    while True:
-        params = {"per_page": 100, "page": page}
-        url = f"{API_ROOT}/repos/{owner}/{repo}/pulls/{pr_number}/comments"
-        resp = requests.get(url, headers=headers, params=params, timeout=30)
-        if resp.status_code >= 400:
-            raise utils.PullPalError(f"GitHub comment fetch failed: {resp.text}")
-        batch = resp.json()
-        if not batch:
-            break
-        comments.extend(batch)
-        if "next" not in _parse_link_header(resp.headers.get("Link")):
-            break
+    while batches[-1] and "next" in _parse_link_header(resp.headers.get("Link")):
         page += 1
-    valid = [c for c in comments if c.get("path") and c.get("line")]
-    return valid
+        resp = client.request("GET", path, params=_page_params(page))
+        batches.append(resp.json())
+    return _valid(batches)
+
+
+async def fetch_comments_async(client: AsyncGitHubClient, owner: str, repo: str, pr_number: int) -> List[Dict]:
+    path = _comments_path(owner, repo, pr_number)
+    resp = await client.request("GET", path, params=_page_params(1))
+    batches = [resp.json()]
+    last = _last_page(resp.headers.get("Link"))
+    if last is not None and last > 1:
+        # Concurrency is bounded by the client's connection limit.
+        pages = range(2, last + 1)
+        batches.extend(await asyncio.gather(*(client.get_json(path, params=_page_params(page)) for page in pages)))
+        return _valid(batches)
+    page = 1
+    while batches[-1] and "next" in _parse_link_header(resp.headers.get("Link")):
+        page += 1
+        resp = await client.request("GET", path, params=_page_params(page))
+        batches.append(resp.json())
+    return _valid(batches)
 
 
 def _parse_link_header(link_header: Optional[str]) -> Dict[str, str]:
@@ -47,19 +108,184 @@ def _parse_link_header(link_header: Optional[str]) -> Dict[str, str]:
     return links
 
 
+def _threads_query(numbers: Sequence[int]) -> str:
+    """One query fetching a page of review threads for each PR, aliased as ``pr<N>``."""
+    cursors = ", ".join(f"$after{number}: String" for number in numbers)
+    fields = "\n".join(
+        f"pr{number}: pullRequest(number: {number}) {{ reviewThreads(first: {THREADS_PAGE}, after: $after{number}) "
+        f"{{ {THREAD_FIELDS} }} }}"
+        for number in numbers
+    )
+    return f"query($owner: String!, $repo: String!, {cursors}) {{ repository(owner: $owner, name: $repo) {{ {fields} }} }}"
+
+
+def _thread_comments_query(count: int) -> str:
+    """One query fetching the next page of comments for ``count`` threads, aliased as ``t<i>``."""
+    cursors = ", ".join(f"$thread{pos}: ID!, $after{pos}: String" for pos in range(count))
+    fields = "\n".join(
+        f"t{pos}: node(id: $thread{pos}) {{ ... on PullRequestReviewThread "
+        f"{{ comments(first: {THREAD_COMMENTS}, after: $after{pos}) {{ {COMMENTS_PAGE} }} }} }}"
+        for pos in range(count)
+    )
+    return f"query({cursors}) {{ {fields} }}"
+
+
+def _rest_comment(node: Dict) -> Dict:
+    """Reshape a GraphQL review comment into the REST fields the pipeline reads."""
+    return {
+        "id": node["databaseId"],
+        "path": node["path"],
+        "line": node["line"],
+        "original_line": node["originalLine"],
+        "body": node["body"],
+        "diff_hunk": node["diffHunk"],
+        "created_at": node["createdAt"],
+        "commit_id": (node.get("commit") or {}).get("oid"),
+        "in_reply_to_id": (node.get("replyTo") or {}).get("databaseId"),
+        "user": {"login": (node.get("author") or {}).get("login")},
+    }
+
+
+async def _fetch_threads_batch(
+    client: AsyncGitHubClient, owner: str, repo: str, numbers: Sequence[int]
+) -> Dict[int, List[Dict]]:
+    comments: Dict[int, List[Dict]] = {number: [] for number in numbers}
+    pending: Dict[int, Optional[str]] = {number: None for number in numbers}
+    # Threads with more than THREAD_COMMENTS comments: (pr number, thread id, comments cursor).
+    long_threads: List[Tuple[int, str, str]] = []
+    while pending:
+        variables = {"owner": owner, "repo": repo, **{f"after{number}": cursor for number, cursor in pending.items()}}
+        # Numbers that are issues or do not exist come back null with a NOT_FOUND error and are
+        # skipped; any other error (rate limits, timeouts, permissions) fails the batch.
+        response = await client.graphql(_threads_query(list(pending)), variables, allow_not_found=True, retry=True)
+        data = response["repository"]
+        for number in list(pending):
+            threads = ((data or {}).get(f"pr{number}") or {}).get("reviewThreads")
+            if threads is None:
+                comments.pop(number)
+                del pending[number]
+                continue
+            for thread in threads["nodes"]:
+                page = thread["comments"]
+                comments[number].extend(_rest_comment(node) for node in page["nodes"])
+                if page["pageInfo"]["hasNextPage"]:
+                    long_threads.append((number, thread["id"], page["pageInfo"]["endCursor"]))
+            if threads["pageInfo"]["hasNextPage"]:
+                pending[number] = threads["pageInfo"]["endCursor"]
+            else:
+                del pending[number]
+    while long_threads:
+        batch, long_threads = long_threads[:GRAPHQL_BATCH], long_threads[GRAPHQL_BATCH:]
+        variables = {}
+        for pos, (_, thread_id, cursor) in enumerate(batch):
+            variables.update({f"thread{pos}": thread_id, f"after{pos}": cursor})
+        data = await client.graphql(_thread_comments_query(len(batch)), variables, retry=True)
+        for pos, (number, thread_id, _) in enumerate(batch):
+            page = data[f"t{pos}"]["comments"]
+            comments[number].extend(_rest_comment(node) for node in page["nodes"])
+            if page["pageInfo"]["hasNextPage"]:
+                long_threads.append((number, thread_id, page["pageInfo"]["endCursor"]))
+    return {number: sorted(_valid([rows]), key=lambda c: c["id"]) for number, rows in comments.items()}
+
+
+async def fetch_threads_graphql(
+    client: AsyncGitHubClient, owner: str, repo: str, numbers: Sequence[int], batch_size: int = GRAPHQL_BATCH
+) -> Dict[int, List[Dict]]:
+    """Review comments for many PRs of one repo, ``batch_size`` PRs per GraphQL query.
+
+    Threads are paginated per PR, and threads longer than ``THREAD_COMMENTS`` comments are
+    followed up with batched per-thread queries.
+    """
+    batches = [numbers[start : start + batch_size] for start in range(0, len(numbers), batch_size)]
+    results: Dict[int, List[Dict]] = {}
+    for found in await asyncio.gather(*(_fetch_threads_batch(client, owner, repo, batch) for batch in batches)):
+        results.update(found)
+    return results
+
+
+async def fetch_many(
+    refs: Sequence[utils.RepoRef], *, mode: str = "rest", concurrency: int = 16, batch_size: int = GRAPHQL_BATCH
+) -> Dict[utils.RepoRef, List[Dict]]:
+    """Comments for every PR in ``refs``; PRs that cannot be fetched are reported and left out."""
+    results: Dict[utils.RepoRef, List[Dict]] = {}
+    async with AsyncGitHubClient(max_connections=concurrency) as client:
+        if mode == "graphql":
+            by_repo: Dict[tuple, List[int]] = {}
+            for ref in refs:
+                by_repo.setdefault((ref.owner, ref.repo), []).append(ref.pr)
+            for (owner, repo), numbers in by_repo.items():
+                found = await fetch_threads_graphql(client, owner, repo, numbers, batch_size)
+                for number in numbers:
+                    if number not in found:
+                        print(f"[skip] {owner}/{repo}#{number}: pull request not found")
+                results.update((utils.RepoRef(owner, repo, number), rows) for number, rows in found.items())
+        else:
+            slots = asyncio.Semaphore(concurrency)
+
+            async def fetch_one(ref: utils.RepoRef) -> None:
+                async with slots:
+                    try:
+                        results[ref] = await fetch_comments_async(client, ref.owner, ref.repo, ref.pr)
+                    except utils.PullPalError as exc:
+                        print(f"[skip] {ref.owner}/{ref.repo}#{ref.pr}: {exc}")
+
+            await asyncio.gather(*(fetch_one(ref) for ref in refs))
+    return {ref: results[ref] for ref in refs if ref in results}
+
+
+def _combined_rows(results: Dict[utils.RepoRef, List[Dict]]) -> Iterator[Dict]:
+    for ref, comments in results.items():
+        for comment in comments:
+            yield {"repo": f"{ref.owner}/{ref.repo}", "pr": ref.pr, **comment}
+
+
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Fetch review comments from a GitHub PR.")
-    parser.add_argument("--owner", required=True)
-    parser.add_argument("--repo", required=True)
-    parser.add_argument("--pr", type=int, required=True)
-    parser.add_argument("--out", type=Path, default=None)
+    parser = argparse.ArgumentParser(description="Fetch review comments from GitHub PRs.")
+    parser.add_argument("specs", nargs="*", help="Bulk mode: PRs as owner/repo#N or owner/repo#N-M ranges.")
+    parser.add_argument("--owner")
+    parser.add_argument("--repo")
+    parser.add_argument("--pr", type=int)
+    parser.add_argument("--pr-file", type=Path, default=None, help="File with one PR spec per line (bulk mode).")
+    parser.add_argument(
+        "--mode",
+        choices=("rest", "graphql"),
+        default="rest",
+        help="Bulk mode source: REST pages fetched in parallel, or batched GraphQL review-thread queries.",
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once (bulk mode).")
+    parser.add_argument("--graphql-batch", type=int, default=GRAPHQL_BATCH, help="PRs per GraphQL query.")
+    parser.add_argument("--per-pr", action="store_true", help="Bulk mode: also write pull_comments.json per PR.")
+    parser.add_argument("--out", type=Path, default=None, help="Output file; a combined JSONL file in bulk mode.")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
-    comments = fetch_comments(args.owner, args.repo, args.pr)
-    ref = utils.RepoRef(args.owner, args.repo, args.pr)
-    out_path = args.out or (ref.pr_dir / "pull_comments.json")
-    utils.dump_json(comments, out_path)
-    print(f"Saved {len(comments)} comments to {out_path}")
+    specs = list(args.specs)
+    if args.pr_file:
+        specs.extend(args.pr_file.read_text(encoding="utf-8").splitlines())
+    if not specs:
+        if not (args.owner and args.repo and args.pr):
+            parser.error("give --owner, --repo and --pr, or PR specs for bulk mode")
+        ref = utils.RepoRef(args.owner, args.repo, args.pr)
+        out_path = args.out or (ref.pr_dir / "pull_comments.json")
+        with instrument.session(args, "fetch_comments", pr=f"{args.owner}/{args.repo}#{args.pr}"):
+            comments = fetch_comments(args.owner, args.repo, args.pr)
+            utils.dump_json(comments, out_path)
+        print(f"Saved {len(comments)} comments to {out_path}")
+        return
+
+    refs = utils.parse_pr_refs(specs)
+    if args.out is None:
+        parser.error("--out is required in bulk mode")
+    with instrument.session(args, "fetch_comments", prs=len(refs), mode=args.mode):
+        results = asyncio.run(
+            fetch_many(refs, mode=args.mode, concurrency=args.concurrency, batch_size=args.graphql_batch)
+        )
+        utils.dump_jsonl(_combined_rows(results), args.out)
+        if args.per_pr:
+            for ref, comments in results.items():
+                utils.dump_json(comments, ref.pr_dir / "pull_comments.json")
+    total = sum(len(comments) for comments in results.values())
+    print(f"Saved {total} comments from {len(results)}/{len(refs)} PRs to {args.out}")
 
 
 if __name__ == "__main__":
@@ -4,27 +4,26 @@ import argparse
 from pathlib import Path
 from typing import Any, Dict
 
-import requests
+from core import instrument, utils
+from core.github import AsyncGitHubClient, get_client
 
-from core import utils
 
+def fetch_pr(owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
+    return get_client().get_json(f"/repos/{owner}/{repo}/pulls/{pr_number}")
 
-API_ROOT = "https://api.github.com"
 
+def fetch_patch(owner: str, repo: str, pr_number: int) -> bytes:
+    path = f"/repos/{owner}/{repo}/pulls/{pr_number}"
+    return get_client().get_binary(path, accept="application/vnd.github.v3.patch")
 
-def fetch_pr(owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
-    url = f"{API_ROOT}/repos/{owner}/{repo}/pulls/{pr_number}"
-    return utils.github_get(url)
 
+async def fetch_pr_async(client: AsyncGitHubClient, owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
+    return await client.get_json(f"/repos/{owner}/{repo}/pulls/{pr_number}")
 
-def fetch_patch(owner: str, repo: str, pr_number: int) -> bytes:
-    url = f"{API_ROOT}/repos/{owner}/{repo}/pulls/{pr_number}"
-    headers = utils.github_headers()
-    headers["Accept"] = "application/vnd.github.v3.patch"
-    resp = requests.get(url, headers=headers, timeout=30)
-    if resp.status_code >= 400:
-        raise utils.PullPalError(f"Failed to download patch: {resp.text}")
-    return resp.content
+
+async def fetch_patch_async(client: AsyncGitHubClient, owner: str, repo: str, pr_number: int) -> bytes:
+    path = f"/repos/{owner}/{repo}/pulls/{pr_number}"
+    return await client.get_binary(path, accept="application/vnd.github.v3.patch")
 
 
 def main() -> None:
@@ -33,17 +32,19 @@ def main() -> None:
     parser.add_argument("--repo", required=True)
     parser.add_argument("--pr", type=int, required=True)
     parser.add_argument("--out", type=Path, default=None, help="Optional override for output directory.")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
     ref = utils.RepoRef(owner=args.owner, repo=args.repo, pr=args.pr)
     out_dir = Path(args.out) if args.out else ref.pr_dir
     utils.ensure_dir(out_dir)
 
-    metadata = fetch_pr(args.owner, args.repo, args.pr)
-    patch_bytes = fetch_patch(args.owner, args.repo, args.pr)
+    with instrument.session(args, "fetch_pr", pr=f"{args.owner}/{args.repo}#{args.pr}"):
+        metadata = fetch_pr(args.owner, args.repo, args.pr)
+        patch_bytes = fetch_patch(args.owner, args.repo, args.pr)
 
-    utils.dump_json(metadata, out_dir / "metadata.json")
-    (out_dir / "diff.patch").write_bytes(patch_bytes)
+        utils.dump_json(metadata, out_dir / "metadata.json")
+        utils.write_bytes(patch_bytes, out_dir / "diff.patch")
     print(f"Saved PR #{args.pr} metadata and diff to {out_dir}")
 
 
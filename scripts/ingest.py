@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from add_context import add_context
+from build_examples import build_examples
+from diff_parser import parse_patch_file
+from fetch_comments import fetch_comments_async
+from fetch_pr import fetch_patch_async, fetch_pr_async
+from merge_lints import merge_lints
+
+from core import instrument, utils
+from core.cache import DEFAULT_CACHE_PATH
+from core.git_store import changed_since, pr_heads
+from core.github import AsyncGitHubClient
+
+
+STATE_FILE = "ingest_state.json"
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    deps: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    kind: str  # "io" stages run on the event loop, "cpu" stages in the process pool
+
+    @property
+    def files(self) -> Tuple[str, ...]:
+        """Output file names with ``{ext}`` resolved to the configured artifact format."""
+        return tuple(name.format(ext=utils.artifact_suffix()) for name in self.outputs)
+
+
+STAGES: Tuple[Stage, ...] = (
+    Stage("fetch_pr", (), ("metadata.json", "diff.patch"), "io"),
+    Stage("fetch_comments", (), ("pull_comments.json",), "io"),
+    Stage("parse_diff", ("fetch_pr",), ("diff_summary{ext}", "diff_full{ext}"), "cpu"),
+    Stage("add_context", ("parse_diff",), ("diff_with_ctx{ext}",), "cpu"),
+    Stage("merge_lints", ("parse_diff",), ("diff_with_lint{ext}",), "cpu"),
+    Stage("build_examples", ("add_context", "merge_lints", "fetch_comments"), ("examples.jsonl",), "cpu"),
+)
+
+
+def _stamp(path: Path) -> List[int]:
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class StageState:
+    """Per-PR record of finished stages and the size and mtime of each output they wrote.
+
+    An output rewritten since, even to the same size, makes its stage run again. CPU
+    stages also record the head/base SHAs they processed, so a PR that moved
+    to new commits re-runs them against the previous outputs.
+    """
+
+    def __init__(self, pr_dir: Path):
+        self.path = pr_dir / STATE_FILE
+        self.pr_dir = pr_dir
+        self.data: Dict[str, Dict] = utils.load_json(self.path) if self.path.exists() else {"stages": {}}
+
+    def heads(self) -> Optional[Dict[str, str]]:
+        metadata_path = self.pr_dir / "metadata.json"
+        return pr_heads(utils.load_json(metadata_path)) if metadata_path.exists() else None
+
+    def _intact(self, stage: Stage) -> Optional[Dict]:
+        record = self.data["stages"].get(stage.name)
+        if record is None:
+            return None
+        for name in stage.files:
+            out = self.pr_dir / name
+            if not out.exists() or _stamp(out) != record["outputs"].get(name):
+                return None
+        return record
+
+    def is_done(self, stage: Stage) -> bool:
+        record = self._intact(stage)
+        if record is None:
+            return False
+        # Records written before heads were tracked are taken as current.
+        return stage.kind != "cpu" or record.get("heads", self.heads()) == self.heads()
+
+    def digest(self, stage: Stage) -> Optional[str]:
+        sha = hashlib.sha1()
+        for name in stage.files:
+            out = self.pr_dir / name
+            if not out.exists():
+                return None
+            sha.update(out.read_bytes())
+        return sha.hexdigest()
+
+    def previous_heads(self, stage: Stage) -> Optional[Dict[str, str]]:
+        """Head/base SHAs behind the stage's existing outputs, if they are intact."""
+        record = self._intact(stage)
+        return record.get("heads") if record else None
+
+    def mark_done(self, stage: Stage) -> None:
+        outputs = {name: _stamp(self.pr_dir / name) for name in stage.files}
+        self.data["stages"][stage.name] = {"outputs": outputs}
+        if stage.kind == "cpu":
+            self.data["stages"][stage.name]["heads"] = self.heads()
+        utils.dump_json(self.data, self.path)
+
+
+def _changed(pr_dir: Path, previous: Optional[Dict[str, str]]) -> Optional[Set[str]]:
+    """Files to recompute when the PR moved on from ``previous``; None means all of them."""
+    if previous is None:
+        return None
+    return changed_since(utils.load_json(pr_dir / "metadata.json"), previous)
+
+
+def _run_parse_diff(pr_dir: str, cache_path: Optional[str], previous: Optional[Dict[str, str]]) -> None:
+    base = Path(pr_dir)
+    parse_patch_file(base / "diff.patch", changed=_changed(base, previous))
+
+
+def _run_add_context(pr_dir: str, cache_path: Optional[str], previous: Optional[Dict[str, str]]) -> None:
+    base = Path(pr_dir)
+    add_context(
+        utils.artifact_path(base, "diff_summary"),
+        base / "metadata.json",
+        cache_path=cache_path and Path(cache_path),
+        changed=_changed(base, previous),
+    )
+
+
+def _run_merge_lints(pr_dir: str, cache_path: Optional[str], previous: Optional[Dict[str, str]]) -> None:
+    base = Path(pr_dir)
+    merge_lints(
+        utils.artifact_path(base, "diff_full"),
+        workers=1,
+        cache_path=cache_path and Path(cache_path),
+        changed=_changed(base, previous),
+    )
+
+
+def _run_build_examples(pr_dir: str, cache_path: Optional[str], previous: Optional[Dict[str, str]]) -> None:
+    base = Path(pr_dir)
+    examples = build_examples(
+        utils.artifact_path(base, "diff_with_lint"), utils.artifact_path(base, "diff_with_ctx"), base / "pull_comments.json"
+    )
+    utils.dump_jsonl(examples, base / "examples.jsonl")
+
+
+CPU_STAGES: Dict[str, Callable[[str, Optional[str], Optional[Dict[str, str]]], None]] = {
+    "parse_diff": _run_parse_diff,
+    "add_context": _run_add_context,
+    "merge_lints": _run_merge_lints,
+    "build_examples": _run_build_examples,
+}
+
+
+def _run_cpu_stage(
+    name: str, pr_dir: str, cache_path: Optional[str], previous: Optional[Dict[str, str]], pr: str
+) -> None:
+    # Runs in a pool worker, so the PR label has to be re-attached for trace records.
+    with instrument.context(pr=pr):
+        CPU_STAGES[name](pr_dir, cache_path, previous)
+
+
+async def _fetch_pr_stage(client: AsyncGitHubClient, ref: utils.RepoRef, pr_dir: Path) -> None:
+    metadata, patch = await asyncio.gather(
+        fetch_pr_async(client, ref.owner, ref.repo, ref.pr),
+        fetch_patch_async(client, ref.owner, ref.repo, ref.pr),
+    )
+    utils.write_bytes(patch, pr_dir / "diff.patch")
+    utils.dump_json(metadata, pr_dir / "metadata.json")
+
+
+async def _fetch_comments_stage(client: AsyncGitHubClient, ref: utils.RepoRef, pr_dir: Path) -> None:
+    comments = await fetch_comments_async(client, ref.owner, ref.repo, ref.pr)
+    utils.dump_json(comments, pr_dir / "pull_comments.json")
+
+
+IO_STAGES: Dict[str, Callable[[AsyncGitHubClient, utils.RepoRef, Path], Awaitable[None]]] = {
+    "fetch_pr": _fetch_pr_stage,
+    "fetch_comments": _fetch_comments_stage,
+}
+
+
+class Orchestrator:
+    """Runs the per-PR stage DAG for many PRs, skipping stages whose outputs are intact.
+
+    With ``refresh`` the GitHub stages always run; if the PR has new commits, CPU
+    stages then only redo the files that changed since their previous run.
+    """
+
+    def __init__(
+        self,
+        client: AsyncGitHubClient,
+        pool: ProcessPoolExecutor,
+        *,
+        concurrency: int = 16,
+        cache_path: Optional[Path] = DEFAULT_CACHE_PATH,
+        force: bool = False,
+        refresh: bool = False,
+    ):
+        self.client = client
+        self.pool = pool
+        self.cache_path = str(cache_path) if cache_path else None
+        self.force = force
+        self.refresh = refresh
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def _run_stage(self, stage: Stage, ref: utils.RepoRef, state: StageState, deps: List[asyncio.Task]) -> bool:
+        """Run ``stage`` unless it is up to date; returns whether its outputs may have changed."""
+        deps_changed = any(await asyncio.gather(*deps))
+        refetch = self.refresh and stage.kind == "io"
+        if not self.force and not deps_changed and not refetch and state.is_done(stage):
+            return False
+        before = state.digest(stage) if refetch and state.is_done(stage) else None
+        with instrument.stage(f"ingest.{stage.name}", kind=stage.kind):
+            if stage.kind == "io":
+                await IO_STAGES[stage.name](self.client, ref, state.pr_dir)
+            else:
+                loop = asyncio.get_running_loop()
+                label = f"{ref.owner}/{ref.repo}#{ref.pr}"
+                previous = None if self.force else state.previous_heads(stage)
+                await loop.run_in_executor(
+                    self.pool, _run_cpu_stage, stage.name, str(state.pr_dir), self.cache_path, previous, label
+                )
+        state.mark_done(stage)
+        return before is None or before != state.digest(stage)
+
+    async def run_pr(self, ref: utils.RepoRef) -> Optional[str]:
+        async with self._slots:
+            pr_dir = utils.ensure_dir(ref.pr_dir)
+            state = StageState(pr_dir)
+            tasks: Dict[str, asyncio.Task] = {}
+            # Tasks copy the current context, so every stage of this PR is tagged with it.
+            with instrument.context(pr=f"{ref.owner}/{ref.repo}#{ref.pr}"):
+                for stage in STAGES:
+                    deps = [tasks[name] for name in stage.deps]
+                    tasks[stage.name] = asyncio.ensure_future(self._run_stage(stage, ref, state, deps))
+            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+            errors = [res for res in results if isinstance(res, BaseException)]
+            if not errors:
+                return None
+            return "".join(traceback.format_exception(type(errors[0]), errors[0], errors[0].__traceback__))
+
+
+async def _main_async(args: argparse.Namespace, refs: List[utils.RepoRef]) -> int:
+    cache_path = None if args.no_cache else args.cache
+    trace_init = {"initializer": instrument.configure, "initargs": (instrument.trace_path(),)}
+    with ProcessPoolExecutor(max_workers=args.workers, **trace_init) as pool:
+        async with AsyncGitHubClient(max_connections=args.concurrency) as client:
+            orchestrator = Orchestrator(
+                client,
+                pool,
+                concurrency=args.concurrency,
+                cache_path=cache_path,
+                force=args.force,
+                refresh=args.refresh,
+            )
+            failed = 0
+            for ref, error in zip(refs, await asyncio.gather(*(orchestrator.run_pr(ref) for ref in refs))):
+                if error:
+                    failed += 1
+                    print(f"[fail] {ref.owner}/{ref.repo}#{ref.pr}\n{error}", file=sys.stderr)
+    print(f"Ingested {len(refs) - failed}/{len(refs)} PRs")
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the full ingestion pipeline for many PRs.")
+    parser.add_argument("specs", nargs="*", help="PRs as owner/repo#N or owner/repo#N-M ranges.")
+    parser.add_argument("--pr-file", type=Path, default=None, help="File with one PR spec per line.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes for CPU-bound stages.")
+    parser.add_argument("--concurrency", type=int, default=16, help="PRs in flight at once.")
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH, help="Shared blob-SHA cache.")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--force", action="store_true", help="Re-run stages even if their outputs are valid.")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Re-fetch PRs and comments; PRs with new commits only reprocess the files that changed.",
+    )
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    specs = list(args.specs)
+    if args.pr_file:
+        specs.extend(args.pr_file.read_text(encoding="utf-8").splitlines())
+    refs = utils.parse_pr_refs(specs)
+    if not refs:
+        parser.error("no PRs given")
+    with instrument.session(args, "ingest", prs=len(refs)):
+        status = asyncio.run(_main_async(args, refs))
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,112 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
+import os
+import shutil
 from pathlib import Path
+from typing import Dict, List
 
 from datasets import load_dataset
 from transformers import AutoTokenizer
 
+from core import instrument, utils
+from core.prompt import MAX_SOURCE_LENGTH, PromptBuilder
 
-def format_prompt(example: dict) -> str:
-    context = example.get("context") or {}
-    ctx_bits = [
-        context.get("symbol_type"),
-        context.get("symbol"),
-        context.get("signature"),
-    ]
-    ctx_str = " | ".join([bit for bit in ctx_bits if bit])
-    lint = example.get("lint") or []
-    lint_str = " | ".join(f"{item['code']}:{item['message']}" for item in lint)
-    return (
-        f"Review the following change:\n"
-        f"File: {example['path']} (line {example['line']})\n"
-        f"Diff:\n{example['diff_hunk']}\n"
-        f"Context: {ctx_str or 'N/A'}\n"
-        f"Lint: {lint_str or 'none'}"
-    )
 
+# Bump when core.prompt or the tokenized columns change so cached shards are rebuilt.
+PROMPT_VERSION = 3
+MANIFEST = "manifest.json"
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Convert examples JSONL to Hugging Face dataset.")
-    parser.add_argument("--examples", type=Path, required=True)
-    parser.add_argument("--model-name", default="microsoft/codebert-base")
-    parser.add_argument("--out-dir", type=Path, default=Path("data/hf/code_review_ds"))
-    args = parser.parse_args()
 
-    dataset = load_dataset("json", data_files=str(args.examples))["train"]
-    tokenizer = AutoTokenizer.from_pretrained(args.model_name)
+def shard_fingerprint(examples_path: Path, settings: Dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(repr(sorted(settings.items())).encode("utf-8"))
+    with examples_path.open("rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def tokenize_shard(examples_path: Path, out_path: Path, tokenizer, args: argparse.Namespace) -> None:
+    with instrument.stage("tokenize_shard", path=examples_path.name, bytes=examples_path.stat().st_size) as record:
+        dataset = load_dataset("json", data_files=str(examples_path))["train"]
+        record["examples"] = len(dataset)
+        _tokenize_dataset(dataset, out_path, tokenizer, args)
+
+
+def _tokenize_dataset(dataset, out_path: Path, tokenizer, args: argparse.Namespace) -> None:
+    prompts = PromptBuilder(tokenizer, args.max_source_length)
 
     def tokenize(batch):
-        prompts = [format_prompt(ex) for ex in batch]
-        comments = [ex["comment"] for ex in batch]
+        rows = [dict(zip(batch.keys(), values)) for values in zip(*batch.values())]
+        input_ids = prompts.build_batch(rows)
+        comments = [ex["comment"] for ex in rows]
 
-        model_inputs = tokenizer(prompts, truncation=True, padding="max_length", max_length=512)
-        with tokenizer.as_target_tokenizer():
-            labels = tokenizer(comments, truncation=True, padding="max_length", max_length=256)
+        # Stored unpadded; train.py pads per batch and groups similar lengths together.
+        model_inputs = {"input_ids": input_ids, "attention_mask": [[1] * len(ids) for ids in input_ids]}
+        labels = tokenizer(text_target=comments, truncation=True, max_length=args.max_target_length)
         model_inputs["labels"] = labels["input_ids"]
+        model_inputs["length"] = [len(ids) for ids in model_inputs["input_ids"]]
         return model_inputs
 
-    tokenized = dataset.map(tokenize, batched=True, remove_columns=dataset.column_names)
-    tokenized.save_to_disk(args.out_dir)
-    print(f"Saved dataset to {args.out_dir}")
+    with instrument.stage("tokenize.map", num_proc=args.num_proc):
+        tokenized = dataset.map(
+            tokenize,
+            batched=True,
+            num_proc=min(args.num_proc, max(1, len(dataset))) if args.num_proc > 1 else None,
+            remove_columns=dataset.column_names,
+        )
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    with instrument.stage("tokenize.save", path=out_path.name):
+        tokenized.save_to_disk(str(tmp_path), max_shard_size=args.max_shard_size)
+    tmp_path.rename(out_path)
+
+
+def build_dataset(args: argparse.Namespace) -> None:
+    tokenizer = AutoTokenizer.from_pretrained(args.model_name)
+    settings = {
+        "model_name": args.model_name,
+        "max_source_length": args.max_source_length,
+        "max_target_length": args.max_target_length,
+        "prompt_version": PROMPT_VERSION,
+    }
+    shards_dir = utils.ensure_dir(args.out_dir / "shards")
+    shard_names: List[str] = []
+    reused = 0
+    for examples_path in args.examples:
+        name = f"{examples_path.stem}-{shard_fingerprint(examples_path, settings)}"
+        shard_names.append(name)
+        if (shards_dir / name).exists():
+            reused += 1
+            continue
+        tokenize_shard(examples_path, shards_dir / name, tokenizer, args)
+        print(f"Tokenized {examples_path} -> {shards_dir / name}")
+
+    if args.prune:
+        for stale in shards_dir.iterdir():
+            if stale.name not in shard_names:
+                shutil.rmtree(stale, ignore_errors=True)
+    utils.dump_json({"shards": [f"shards/{name}" for name in shard_names], **settings}, args.out_dir / MANIFEST)
+    print(f"Saved dataset to {args.out_dir} ({len(shard_names) - reused} tokenized, {reused} reused)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert examples JSONL to Hugging Face dataset.")
+    parser.add_argument("--examples", type=Path, nargs="+", required=True, help="One or more examples JSONL shards.")
+    parser.add_argument("--model-name", default="microsoft/codebert-base")
+    parser.add_argument("--out-dir", type=Path, default=Path("data/hf/code_review_ds"))
+    parser.add_argument("--max-source-length", type=int, default=MAX_SOURCE_LENGTH)
+    parser.add_argument("--max-target-length", type=int, default=256)
+    parser.add_argument("--num-proc", type=int, default=os.cpu_count() or 1, help="Tokenizer worker processes.")
+    parser.add_argument("--max-shard-size", default="500MB", help="Largest Arrow file written per shard.")
+    parser.add_argument("--prune", action="store_true", help="Delete cached shards not used by this run.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.session(args, "make_hf_dataset", shards=len(args.examples)):
+        build_dataset(args)
 
 
 if __name__ == "__main__":
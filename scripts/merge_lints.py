@@ -1,24 +1,33 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import hashlib
+import math
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Set
 
-from core import utils
+from core import instrument, utils
+from core.cache import DEFAULT_CACHE_PATH, BlobCache
+from core.git_store import MIRROR_ROOT, TreeSource, WorkTreeSource, tree_for_metadata
 
 
-def run_flake8(repo_root: Path, rel_path: str) -> List[Dict]:
-    formatted = "%(path)s::%(row)d::%(code)s::%(text)s"
-    cmd = ["flake8", f"--format={formatted}", rel_path]
-    proc = utils.run(cmd, cwd=repo_root, check=False)
-    if proc.returncode not in (0, 1):
-        raise utils.PullPalError(proc.stderr.strip())
+FLAKE8_FORMAT = "%(path)s::%(row)d::%(code)s::%(text)s"
+FLAKE8_CONFIG_FILES = (".flake8", "setup.cfg", "tox.ini")
+
+
+def _parse_flake8(stdout: str) -> List[Dict]:
     warnings: List[Dict] = []
-    for line in proc.stdout.strip().splitlines():
+    for line in stdout.strip().splitlines():
         parts = line.split("::", 3)
         if len(parts) != 4:
             continue
         path, row, code, text = parts
+        if path.startswith("./"):
+            path = path[2:]
         warnings.append(
             {
                 "path": path,
@@ -30,18 +39,137 @@ def run_flake8(repo_root: Path, rel_path: str) -> List[Dict]:
     return warnings
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Attach lint warnings to diff JSON.")
-    parser.add_argument("--diff", type=Path, required=True, help="Path to diff_full.json")
-    parser.add_argument("--repo-dir", type=Path, default=None, help="Repo checkout containing files.")
-    parser.add_argument("--out", type=Path, default=None, help="Output file (defaults to diff_with_lint.json).")
-    args = parser.parse_args()
+def _flake8(args: List[str], cwd: Optional[Path] = None) -> subprocess.CompletedProcess:
+    try:
+        return utils.run(["flake8", *args], cwd=cwd, check=False)
+    except FileNotFoundError as exc:
+        raise utils.PullPalError("flake8 is not installed; pip install flake8 to lint Python files") from exc
+
+
+def run_flake8(repo_root: Path, rel_paths: Sequence[str] | str) -> List[Dict]:
+    if isinstance(rel_paths, str):
+        rel_paths = [rel_paths]
+    with instrument.stage("lint.flake8", files=len(rel_paths)) as record:
+        proc = _flake8([f"--format={FLAKE8_FORMAT}", "--jobs=1", *rel_paths], cwd=repo_root)
+        if proc.returncode not in (0, 1):
+            raise utils.PullPalError(proc.stderr.strip())
+        warnings = _parse_flake8(proc.stdout)
+        record["warnings"] = len(warnings)
+        return warnings
+
+
+@functools.lru_cache(maxsize=1)
+def flake8_version() -> str:
+    """``flake8 --version`` output, which also lists the installed plugins and their versions."""
+    return _flake8(["--version"]).stdout.strip()
+
+
+def config_fingerprint(source: TreeSource) -> str:
+    """Hash the repo's flake8 configuration and flake8 version so cached results follow changes to either."""
+    digest = hashlib.sha1(flake8_version().encode())
+    for name in FLAKE8_CONFIG_FILES:
+        config = source.read(name)
+        if config is not None:
+            digest.update(name.encode())
+            digest.update(config)
+    return digest.hexdigest()[:12]
+
+
+def lint_files(
+    source: TreeSource | Path,
+    rel_paths: Sequence[str],
+    *,
+    workers: Optional[int] = None,
+    cache: Optional[BlobCache] = None,
+) -> Dict[str, List[Dict]]:
+    """Lint many files with a few batched flake8 invocations spread over a worker pool."""
+    if not isinstance(source, TreeSource):
+        source = WorkTreeSource(source)
+    results: Dict[str, List[Dict]] = {path: [] for path in rel_paths}
+    cache_keys: Dict[str, str] = {}
+    pending: List[str] = []
+    for path in rel_paths:
+        sha = source.blob_sha(path)
+        if sha is None:
+            continue
+        if cache is not None:
+            # Keyed by path too: per-file-ignores and filename patterns make results path-dependent.
+            key = f"{sha}:{path}"
+            cached = cache.get(key)
+            if cached is not None:
+                results[path] = [{**warn, "path": path} for warn in cached]
+                continue
+            cache_keys[path] = key
+        pending.append(path)
+
+    if pending:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+        chunks = utils.chunk_list(pending, math.ceil(len(pending) / workers))
+        with instrument.stage("lint.files", files=len(pending), cached=len(rel_paths) - len(pending), workers=workers):
+            with source.materialize([*pending, *FLAKE8_CONFIG_FILES]) as root:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for warnings in pool.map(instrument.bind(lambda chunk: run_flake8(root, chunk)), chunks):
+                        for warn in warnings:
+                            results.setdefault(warn["path"], []).append(warn)
+
+    if cache is not None:
+        for path, key in cache_keys.items():
+            cache.put(key, [{key: val for key, val in warn.items() if key != "path"} for warn in results[path]])
+    return results
 
-    diff_full = utils.load_json(args.diff)
-    repo_root = args.repo_dir or (args.diff.parent / "repo")
+
+def merge_lints(
+    diff_path: Path,
+    *,
+    repo_dir: Optional[Path] = None,
+    metadata_path: Optional[Path] = None,
+    out_path: Optional[Path] = None,
+    workers: Optional[int] = None,
+    cache_path: Optional[Path] = DEFAULT_CACHE_PATH,
+    mirror_root: Path = MIRROR_ROOT,
+    changed: Optional[Set[str]] = None,
+) -> Dict[str, int]:
+    """Write diff_with_lint for one PR and return the lint cache counters.
+
+    Files come from ``repo_dir`` when given, otherwise from the PR head in the
+    shared mirror described by ``metadata_path``. With ``changed``, lints of other
+    files are taken from the existing output when their hunks are unchanged, unless
+    the flake8 configuration itself changed.
+    """
+    diff_full = utils.load_files(diff_path)
+    out_path = out_path or utils.artifact_path(diff_path.parent, "diff_with_lint")
+    if changed is not None and changed & set(FLAKE8_CONFIG_FILES):
+        changed = None
+    previous = utils.previous_files(out_path, changed)
+    reused = {
+        entry["path"]: previous[entry["path"]]["lint"]
+        for entry in diff_full["files"]
+        if entry["path"] in previous and previous[entry["path"]]["hunks"] == entry["hunks"]
+    }
+    mirror = None
+    if repo_dir:
+        source: TreeSource = WorkTreeSource(repo_dir)
+    else:
+        metadata = utils.load_json(metadata_path or (diff_path.parent / "metadata.json"))
+        mirror, source = tree_for_metadata(metadata, mirror_root)
+    py_paths = [
+        entry["path"] for entry in diff_full["files"] if entry["path"].endswith(".py") and entry["path"] not in reused
+    ]
+    cache = None
+    try:
+        # PRs without Python files to lint never need flake8 (or its version for the cache namespace).
+        if cache_path and py_paths:
+            cache = BlobCache(cache_path, namespace=f"flake8:{config_fingerprint(source)}")
+        lint_by_path = lint_files(source, py_paths, workers=workers, cache=cache) if py_paths else {}
+    finally:
+        if mirror is not None:
+            mirror.close()
 
     for file_entry in diff_full["files"]:
         path = file_entry["path"]
+        if path in reused:
+            file_entry["lint"] = reused[path]
+            continue
         if not path.endswith(".py"):
             file_entry["lint"] = []
             continue
@@ -51,12 +179,46 @@ def main() -> None:
             for line in hunk["lines"]
             if line["type"] == "add" and line["target"] is not None
         }
-        lints = [warn for warn in run_flake8(Path(repo_root), path) if warn["line"] in changed_lines]
+        lints = [warn for warn in lint_by_path.get(path, []) if warn["line"] in changed_lines]
         file_entry["lint"] = lints
 
-    out_path = args.out or (args.diff.parent / "diff_with_lint.json")
-    utils.dump_json(diff_full, out_path)
+    utils.dump_files(diff_full, out_path)
+    if cache is None:
+        return {}
+    cache.close()
+    return cache.stats()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Attach lint warnings to the parsed diff.")
+    parser.add_argument("--diff", type=Path, required=True, help="Path to diff_full (.arrow, .json or .jsonl)")
+    parser.add_argument("--repo-dir", type=Path, default=None, help="Existing checkout to lint instead of the shared mirror.")
+    parser.add_argument("--metadata", type=Path, default=None, help="metadata.json from fetch_pr (defaults to next to --diff).")
+    parser.add_argument("--mirror-root", type=Path, default=MIRROR_ROOT, help="Directory holding shared bare mirrors.")
+    parser.add_argument("--out", type=Path, default=None, help="Output file (defaults to diff_with_lint next to --diff).")
+    parser.add_argument("--format", choices=sorted(utils.ARTIFACT_FORMATS), default=None, help="Format of the default output.")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel flake8 processes (defaults to CPU count).")
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH, help="SQLite cache of lint results keyed by blob SHA and path.")
+    parser.add_argument("--no-cache", action="store_true", help="Lint every file even if it was seen before.")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    out_path = args.out or utils.artifact_path(args.diff.parent, "diff_with_lint", args.format)
+    metadata_path = args.metadata or (args.diff.parent / "metadata.json")
+    pr = utils.pr_label(utils.load_json(metadata_path)) if metadata_path.exists() else None
+    with instrument.session(args, "merge_lints", pr=pr):
+        stats = merge_lints(
+            args.diff,
+            repo_dir=args.repo_dir,
+            metadata_path=args.metadata,
+            out_path=out_path,
+            workers=args.workers,
+            cache_path=None if args.no_cache else args.cache,
+            mirror_root=args.mirror_root,
+        )
     print(f"Wrote lint-enriched diff to {out_path}")
+    if stats:
+        print(f"Lint cache: {stats['hits']} hits, {stats['misses']} misses")
 
 
 if __name__ == "__main__":
@@ -2,15 +2,14 @@ from __future__ import annotations
 
 import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List
 
 import requests
 
-from core import utils
-
-
-API_ROOT = "https://api.github.com"
+from core import instrument, utils
+from core.github import get_client
 
 
 def load_examples(path: Path) -> List[Dict]:
@@ -22,26 +21,78 @@ def load_examples(path: Path) -> List[Dict]:
     return items
 
 
+_SESSION = requests.Session()
+
+
 def call_model(endpoint: str, payload: Dict) -> str:
-    resp = requests.post(f"{endpoint}/review", json=payload, timeout=30)
+    resp = _SESSION.post(f"{endpoint}/review", json=payload, timeout=30)
     if resp.status_code >= 400:
         raise utils.PullPalError(f"Inference request failed: {resp.text}")
     return resp.json()["comment"]
 
 
-def post_comment(owner: str, repo: str, pr: int, body: str, example: Dict, commit_id: str) -> None:
-    url = f"{API_ROOT}/repos/{owner}/{repo}/pulls/{pr}/comments"
-    headers = utils.github_headers()
-    data = {
-        "body": body,
-        "path": example["path"],
-        "line": example["line"],
-        "side": "RIGHT",
+def call_model_batch(endpoint: str, payloads: List[Dict]) -> List[str]:
+    resp = _SESSION.post(f"{endpoint}/review/batch", json={"items": payloads}, timeout=120)
+    if resp.status_code >= 400:
+        raise utils.PullPalError(f"Batch inference request failed: {resp.text}")
+    return [item["comment"] for item in resp.json()["results"]]
+
+
+def generate_comments(
+    endpoint: str, examples: List[Dict], *, concurrency: int = 8, batch_size: int = 0
+) -> List[str]:
+    """Get one suggestion per example, via /review/batch chunks or concurrent /review calls."""
+    if batch_size > 0:
+        chunks = utils.chunk_list(examples, batch_size)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = pool.map(lambda chunk: call_model_batch(endpoint, chunk), chunks)
+        return [comment for chunk_comments in results for comment in chunk_comments]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return list(pool.map(lambda example: call_model(endpoint, example), examples))
+
+
+def build_review(examples: List[Dict], comments: List[str], commit_id: str) -> Dict[str, Any]:
+    """Assemble a single pull request review carrying every non-empty inline suggestion."""
+    inline = [
+        {
+            "body": body,
+            "path": example["path"],
+            "line": example["line"],
+            "side": "RIGHT",
+        }
+        for example, body in zip(examples, comments)
+        if body
+    ]
+    return {
         "commit_id": commit_id,
+        "event": "COMMENT",
+        "body": f"Pull Pal left {len(inline)} suggestion(s).",
+        "comments": inline,
     }
-    resp = requests.post(url, headers=headers, json=data, timeout=30)
-    if resp.status_code >= 400:
-        raise utils.PullPalError(f"Failed to post comment: {resp.text}")
+
+
+def submit_review(owner: str, repo: str, pr: int, review: Dict[str, Any]) -> Dict[str, Any]:
+    return get_client().post_json(f"/repos/{owner}/{repo}/pulls/{pr}/reviews", review)
+
+
+def publish(args: argparse.Namespace, examples: List[Dict], commit_id: str) -> None:
+    with instrument.stage("generate_comments", examples=len(examples)):
+        comments = generate_comments(args.endpoint, examples, concurrency=args.concurrency, batch_size=args.batch_size)
+    review = build_review(examples, comments, commit_id)
+    if not review["comments"]:
+        print("No suggestions to post.")
+        return
+
+    if args.dry_run is not None:
+        if str(args.dry_run) == "-":
+            print(json.dumps(review, indent=2))
+        else:
+            utils.dump_json(review, args.dry_run)
+            print(f"Wrote review payload with {len(review['comments'])} comments to {args.dry_run}")
+        return
+
+    submit_review(args.owner, args.repo, args.pr, review)
+    print(f"Posted review with {len(review['comments'])} comments on PR #{args.pr}")
 
 
 def main() -> None:
@@ -53,16 +104,25 @@ def main() -> None:
     parser.add_argument("--metadata", type=Path, required=True)
     parser.add_argument("--endpoint", required=True, help="Base URL for the FastAPI service.")
     parser.add_argument("--limit", type=int, default=5, help="Max comments to post.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Inference requests in flight.")
+    parser.add_argument("--batch-size", type=int, default=0, help="Use /review/batch with this many examples per call.")
+    parser.add_argument(
+        "--dry-run",
+        type=Path,
+        nargs="?",
+        const=Path("-"),
+        default=None,
+        help="Write the review payload to this file (stdout if omitted) instead of posting it.",
+    )
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
     examples = load_examples(args.examples)[: args.limit]
     metadata = utils.load_json(args.metadata)
     commit_id = metadata["head"]["sha"]
 
-    for example in examples:
-        comment = call_model(args.endpoint, example)
-        post_comment(args.owner, args.repo, args.pr, comment, example, commit_id)
-        print(f"Posted review for {example['path']}:{example['line']}")
+    with instrument.session(args, "publish_reviews", pr=f"{args.owner}/{args.repo}#{args.pr}"):
+        publish(args, examples, commit_id)
 
 
 if __name__ == "__main__":
@@ -1,35 +1,160 @@
 from __future__ import annotations
 
 import argparse
+import json
+import math
+import os
+import time
 from pathlib import Path
+from typing import List, Optional
 
-from datasets import load_from_disk
+import torch
+from datasets import Dataset, concatenate_datasets, load_from_disk
 from transformers import (
     AutoTokenizer,
     DataCollatorForSeq2Seq,
     EncoderDecoderModel,
     Trainer,
+    TrainerCallback,
     TrainingArguments,
 )
 
+from core import instrument
+
+
+class TokenStats:
+    """Counts real vs. padded tokens fed to the model during one epoch."""
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.started = time.perf_counter()
+
+    def update(self, inputs) -> None:
+        self.real_tokens += int(inputs["attention_mask"].sum())
+        self.padded_tokens += inputs["input_ids"].numel()
+        if "labels" in inputs:
+            labels = inputs["labels"]
+            self.real_tokens += int((labels != -100).sum())
+            self.padded_tokens += labels.numel()
+
+    def summary(self) -> dict:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        padding = 1 - self.real_tokens / self.padded_tokens if self.padded_tokens else 0.0
+        return {"tokens_per_sec": self.real_tokens / elapsed, "padding_ratio": padding}
+
+
+class StatsTrainer(Trainer):
+    def __init__(self, *args, token_stats: TokenStats, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_stats = token_stats
+        self._last_log = (0, time.perf_counter())
+
+    def training_step(self, model, inputs):
+        self.token_stats.update(inputs)
+        return super().training_step(model, inputs)
+
+    def log(self, logs):
+        last_step, last_time = self._last_log
+        now = time.perf_counter()
+        step = self.state.global_step
+        if "loss" in logs and step > last_step:
+            samples_per_step = (
+                self.args.per_device_train_batch_size * self.args.gradient_accumulation_steps * self.args.world_size
+            )
+            logs["samples_per_sec"] = round((step - last_step) * samples_per_step / max(now - last_time, 1e-9), 3)
+            logs["peak_rss_mb"] = round(instrument.peak_rss_mb(), 1)
+            self._last_log = (step, now)
+        super().log(logs)
+
+
+class EpochStatsCallback(TrainerCallback):
+    def __init__(self, token_stats: TokenStats):
+        self.token_stats = token_stats
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.token_stats.reset()
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        stats = self.token_stats.summary()
+        state.log_history.append({"epoch": state.epoch, "step": state.global_step, **stats})
+        print(
+            f"Epoch {state.epoch:.2f}: {stats['tokens_per_sec']:.1f} tokens/sec, "
+            f"padding ratio {stats['padding_ratio']:.1%}"
+        )
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Fine-tune CodeBERT on code review examples.")
-    parser.add_argument("--dataset", type=Path, required=True, help="Path to HF dataset directory.")
-    parser.add_argument("--output", type=Path, default=Path("model/checkpoints"))
-    parser.add_argument("--model-name", default="microsoft/codebert-base")
-    parser.add_argument("--epochs", type=int, default=3)
-    parser.add_argument("--batch-size", type=int, default=2)
-    args = parser.parse_args()
 
-    dataset = load_from_disk(str(args.dataset))
-    tokenizer = AutoTokenizer.from_pretrained(args.model_name)
-    model = EncoderDecoderModel.from_encoder_decoder_pretrained(args.model_name, args.model_name)
+def cpu_supports_bf16() -> bool:
+    """True when the CPU has native bf16 matmul (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as fh:
+            flags = next((line for line in fh if line.startswith("flags")), "")
+    except OSError:
+        return False
+    return any(flag in flags.split() for flag in ("avx512_bf16", "amx_bf16"))
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    cpus: List[int] = []
+    for part in spec.split(","):
+        start, _, end = part.partition("-")
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def configure_cpu(threads: Optional[int], affinity: Optional[str]) -> int:
+    """Pin the process and size torch's intra-op pool; returns the thread count in use."""
+    if affinity:
+        os.sched_setaffinity(0, parse_cpu_list(affinity))
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    threads = threads or available
+    torch.set_num_threads(threads)
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    return threads
+
+
+def load_review_dataset(path: Path) -> Dataset:
+    """Memory-map a dataset written by make_hf_dataset (sharded manifest or a single save)."""
+    manifest = path / "manifest.json"
+    if not manifest.exists():
+        return load_from_disk(str(path))
+    shards = json.loads(manifest.read_text(encoding="utf-8"))["shards"]
+    return concatenate_datasets([load_from_disk(str(path / shard)) for shard in shards])
+
+
+def train(args: argparse.Namespace) -> None:
+    bf16_mode = args.bf16 or ("auto" if args.cpu_throughput else "off")
+    use_bf16 = bf16_mode == "on" or (bf16_mode == "auto" and cpu_supports_bf16())
+    workers = args.dataloader_workers
+    if workers is None:
+        workers = 2 if args.cpu_throughput else 0
+    threads = None
+    if args.cpu_throughput or args.threads or args.cpu_affinity:
+        threads = configure_cpu(args.threads, args.cpu_affinity)
+    accumulation = 1
+    if args.target_batch_size:
+        accumulation = max(1, math.ceil(args.target_batch_size / args.batch_size))
+    print(
+        f"CPU settings: threads={threads or torch.get_num_threads()} bf16={use_bf16} "
+        f"accumulation={accumulation} workers={workers}"
+    )
+
+    with instrument.stage("load_dataset") as record:
+        dataset = load_review_dataset(args.dataset)
+        record["examples"] = len(dataset)
+    with instrument.stage("load_model", model=args.model_name):
+        tokenizer = AutoTokenizer.from_pretrained(args.model_name)
+        model = EncoderDecoderModel.from_encoder_decoder_pretrained(args.model_name, args.model_name)
     model.config.decoder_start_token_id = tokenizer.bos_token_id or tokenizer.cls_token_id
     model.config.pad_token_id = tokenizer.pad_token_id
     model.config.vocab_size = model.config.encoder.vocab_size
 
+    # Pads each batch to its own longest sequence; labels are padded with -100.
     data_collator = DataCollatorForSeq2Seq(tokenizer=tokenizer, model=model)
+    group_by_length = not args.no_group_by_length and "length" in dataset.column_names
 
     training_args = TrainingArguments(
         output_dir=str(args.output),
@@ -39,19 +164,62 @@ def main() -> None:
         logging_steps=50,
         learning_rate=5e-5,
         weight_decay=0.01,
+        group_by_length=group_by_length,
+        length_column_name="length",
+        use_cpu=args.cpu_throughput,
+        gradient_accumulation_steps=accumulation,
+        bf16=use_bf16,
+        gradient_checkpointing=args.gradient_checkpointing,
+        torch_compile=args.torch_compile,
+        dataloader_num_workers=workers,
+        dataloader_prefetch_factor=args.prefetch_factor if workers else None,
+        dataloader_persistent_workers=workers > 0,
     )
 
-    trainer = Trainer(
+    token_stats = TokenStats()
+    trainer = StatsTrainer(
         model=model,
         args=training_args,
         train_dataset=dataset,
         data_collator=data_collator,
+        callbacks=[EpochStatsCallback(token_stats)],
+        token_stats=token_stats,
     )
-    trainer.train()
-    trainer.save_model(str(args.output / "final"))
-    tokenizer.save_pretrained(str(args.output / "final"))
+    with instrument.stage("train", epochs=args.epochs, examples=len(dataset)):
+        trainer.train()
+    with instrument.stage("save_model"):
+        trainer.save_model(str(args.output / "final"))
+        tokenizer.save_pretrained(str(args.output / "final"))
     print(f"Training finished. Artifacts at {args.output}")
 
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fine-tune CodeBERT on code review examples.")
+    parser.add_argument("--dataset", type=Path, required=True, help="Path to HF dataset directory.")
+    parser.add_argument("--output", type=Path, default=Path("model/checkpoints"))
+    parser.add_argument("--model-name", default="microsoft/codebert-base")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument(
+        "--no-group-by-length",
+        action="store_true",
+        help="Shuffle uniformly instead of batching examples of similar length.",
+    )
+    parser.add_argument("--cpu-throughput", action="store_true", help="CPU preset: bf16 auto, 2 loader workers, sized threads.")
+    parser.add_argument("--target-batch-size", type=int, default=None, help="Effective batch reached via accumulation.")
+    parser.add_argument("--bf16", choices=("auto", "on", "off"), default=None, help="bf16 autocast on CPU.")
+    parser.add_argument("--gradient-checkpointing", action="store_true")
+    parser.add_argument("--torch-compile", action="store_true")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads (defaults to usable CPUs).")
+    parser.add_argument("--cpu-affinity", default=None, help="CPU list to pin to, e.g. 0-15 or 0-7,16-23.")
+    parser.add_argument("--dataloader-workers", type=int, default=None)
+    parser.add_argument("--prefetch-factor", type=int, default=2)
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrument.session(args, "train"):
+        train(args)
+
+
 if __name__ == "__main__":
     main()
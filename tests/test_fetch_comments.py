@@ -0,0 +1,220 @@
+"""fetch_comments against a local fake GitHub serving paginated REST and GraphQL responses."""
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import fetch_comments
+from core import github, utils
+
+
+THREAD_SIZE = 3
+# GraphQL answers this PR with a non-NOT_FOUND error, which must fail the fetch.
+FORBIDDEN_PR = 5
+# PR 2 has one thread long enough to need several comment pages in GraphQL mode.
+PRS: Dict[int, List[List[Dict]]] = {}
+
+
+def _comment(number: int, pos: int) -> Dict:
+    return {
+        "id": number * 10_000 + pos,
+        "path": f"pkg/mod{pos % 4}.py",
+        "line": None if pos % 9 == 0 else pos + 1,
+        "original_line": pos + 1,
+        "body": f"comment {pos} on #{number}",
+        "diff_hunk": "@@ -1 +1 @@\n+x = 1",
+        "created_at": "2024-01-01T00:00:00Z",
+        "commit_id": "c0ffee",
+        "in_reply_to_id": None,
+        "user": {"login": "reviewer"},
+    }
+
+
+def _threads(number: int, total: int, long_thread: int = 0) -> List[List[Dict]]:
+    rows = [_comment(number, pos) for pos in range(total)]
+    threads = [rows[:long_thread]] if long_thread else []
+    rest = rows[long_thread:]
+    threads.extend(rest[start : start + THREAD_SIZE] for start in range(0, len(rest), THREAD_SIZE))
+    return threads
+
+
+PRS[1] = _threads(1, 250)
+PRS[2] = _threads(2, 320, long_thread=230)
+PRS[3] = _threads(3, 7)
+
+
+def _rows(number: int) -> List[Dict]:
+    return [row for thread in PRS[number] for row in thread]
+
+
+def _graphql_node(row: Dict) -> Dict:
+    return {
+        "databaseId": row["id"],
+        "body": row["body"],
+        "path": row["path"],
+        "line": row["line"],
+        "originalLine": row["original_line"],
+        "diffHunk": row["diff_hunk"],
+        "createdAt": row["created_at"],
+        "author": row["user"],
+        "commit": {"oid": row["commit_id"]},
+        "replyTo": None,
+    }
+
+
+def _page(rows: List, after: str, first: int) -> Dict:
+    start = int(after or 0)
+    return {
+        "pageInfo": {"hasNextPage": start + first < len(rows), "endCursor": str(start + first)},
+        "slice": rows[start : start + first],
+    }
+
+
+class FakeGitHub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests: List[str] = []
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, body, headers: Dict[str, str] = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        self.requests.append(f"GET {self.path}")
+        match = re.fullmatch(r"/repos/o/r/pulls/(\d+)/comments", url.path)
+        number = int(match.group(1))
+        if number not in PRS:
+            self._send(404, {"message": "Not Found"})
+            return
+        query = {key: int(values[0]) for key, values in parse_qs(url.query).items()}
+        page, per_page = query["page"], query["per_page"]
+        rows = _rows(number)
+        last = max(1, -(-len(rows) // per_page))
+        base = f"http://{self.headers['Host']}{url.path}?per_page={per_page}"
+        headers = {}
+        if page < last:
+            headers["Link"] = f'<{base}&page={page + 1}>; rel="next", <{base}&page={last}>; rel="last"'
+        self._send(200, rows[(page - 1) * per_page : page * per_page], headers)
+
+    def do_POST(self) -> None:
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        query, variables = payload["query"], payload["variables"]
+        self.requests.append(f"POST {query[:40]}")
+        if "node(id:" in query:
+            data = {}
+            for pos, first in re.findall(r"t(\d+): node\(id: \$thread\d+\).*?comments\(first: (\d+)", query):
+                number, index = map(int, variables[f"thread{pos}"].split(":"))
+                page = _page(PRS[number][index], variables[f"after{pos}"], int(first))
+                nodes = [_graphql_node(row) for row in page["slice"]]
+                data[f"t{pos}"] = {"comments": {"pageInfo": page["pageInfo"], "nodes": nodes}}
+            self._send(200, {"data": data})
+            return
+        repository, errors = {}, []
+        pattern = r"pr(\d+): pullRequest\(number: \d+\) \{ reviewThreads\(first: (\d+).*?comments\(first: (\d+)\)"
+        for number, first, comments_first in re.findall(pattern, query, re.S):
+            number = int(number)
+            if number == FORBIDDEN_PR:
+                repository[f"pr{number}"] = None
+                errors.append(
+                    {"type": "FORBIDDEN", "path": ["repository", f"pr{number}"], "message": "Resource not accessible"}
+                )
+                continue
+            if number not in PRS:
+                repository[f"pr{number}"] = None
+                errors.append(
+                    {
+                        "type": "NOT_FOUND",
+                        "path": ["repository", f"pr{number}"],
+                        "message": f"Could not resolve to a PullRequest with the number of {number}.",
+                    }
+                )
+                continue
+            indexed = list(enumerate(PRS[number]))
+            page = _page(indexed, variables[f"after{number}"], int(first))
+            nodes = []
+            for index, thread in page["slice"]:
+                comments = _page(thread, None, int(comments_first))
+                nodes.append(
+                    {
+                        "id": f"{number}:{index}",
+                        "comments": {
+                            "pageInfo": comments["pageInfo"],
+                            "nodes": [_graphql_node(row) for row in comments["slice"]],
+                        },
+                    }
+                )
+            repository[f"pr{number}"] = {"reviewThreads": {"pageInfo": page["pageInfo"], "nodes": nodes}}
+        body = {"data": {"repository": repository}}
+        if errors:
+            body["errors"] = errors
+        self._send(200, body)
+
+
+@pytest.fixture
+def fake_github(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    FakeGitHub.requests = []
+    monkeypatch.setattr(github, "API_ROOT", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(github, "_CLIENTS", {})
+    monkeypatch.setenv("GITHUB_TOKEN", "test-token")
+    monkeypatch.setenv("PULL_PAL_HTTP_CACHE", "")
+    monkeypatch.chdir(tmp_path)
+    yield FakeGitHub
+    server.shutdown()
+    server.server_close()
+
+
+def _expected(number: int) -> List[Dict]:
+    return [row for row in _rows(number) if row["path"] and row["line"]]
+
+
+def test_rest_fetches_every_page(fake_github):
+    comments = fetch_comments.fetch_comments("o", "r", 1)
+
+    assert comments == _expected(1)
+    assert len(fake_github.requests) == 3
+
+
+def test_bulk_rest_skips_missing_prs(fake_github):
+    refs = utils.parse_pr_refs(["o/r#1-4"])
+
+    results = asyncio.run(fetch_comments.fetch_many(refs, mode="rest", concurrency=4))
+
+    assert list(results) == [utils.RepoRef("o", "r", number) for number in (1, 2, 3)]
+    for number in (1, 2, 3):
+        assert results[utils.RepoRef("o", "r", number)] == _expected(number)
+
+
+def test_bulk_graphql_matches_rest_and_follows_long_threads(fake_github):
+    refs = utils.parse_pr_refs(["o/r#1-4"])
+
+    results = asyncio.run(fetch_comments.fetch_many(refs, mode="graphql", batch_size=2))
+
+    assert list(results) == [utils.RepoRef("o", "r", number) for number in (1, 2, 3)]
+    for number in (1, 2, 3):
+        assert results[utils.RepoRef("o", "r", number)] == sorted(_expected(number), key=lambda row: row["id"])
+    assert any(request.startswith("POST query($thread0") for request in fake_github.requests)
+
+
+def test_bulk_graphql_raises_on_errors_other_than_not_found(fake_github):
+    refs = utils.parse_pr_refs([f"o/r#{FORBIDDEN_PR}", "o/r#1"])
+
+    with pytest.raises(utils.PullPalError, match="Resource not accessible"):
+        asyncio.run(fetch_comments.fetch_many(refs, mode="graphql"))